@@ -4,7 +4,7 @@ import logging
 import datetime
 
 from dotenv import load_dotenv
-from src.nuada import request_guardian_headlines, request_nyt_headlines, transform, BatchConfig, DatabaseConfig, DatabaseManager
+import src.nuada as nuada # NB: public names resolve lazily, so heavy dependencies are only imported once the pipeline runs
 
 # Load environment variables (if they exist)
 load_dotenv()
@@ -42,41 +42,115 @@ def parse_credentials() -> dict:
 
     return credentials
 
+def deduplicate_across_sources(headlines: dict, dedup_config: 'nuada.DedupConfig | None', index: 'nuada.HeadlineIndex | None' = None) -> dict:
+    '''
+    Remove headlines syndicated across sources (each is retained by the first source which published it). Headlines are
+    archived beforehand, so that the index still records every source which published them.
+
+    :param headlines: dictionary of headline `pd.DataFrame` objects (keyed by source alias)
+    :param dedup_config: `DedupConfig` instance; `None` for no cross-source deduplication (i.e. `headlines` is returned as is)
+    :param index: `HeadlineIndex` instance into which headlines are archived (optional)
+    '''
+    if dedup_config is None or not headlines:
+        return headlines
+    if index is not None:
+        for source_alias, source_headlines in headlines.items():
+            index.add(source_alias, source_headlines)
+    return nuada.deduplicate_sources(headlines, dedup_config)
+
+def exec_increment(db: 'nuada.DatabaseManager', secrets: dict, index: 'nuada.HeadlineIndex | None' = None, transform_config: 'nuada.TransformConfig | None' = None, cache: 'nuada.TransformCache | None' = None, dedup_sources: 'nuada.DedupConfig | None' = None) -> bool:
+    '''
+    Execute incremental headline(s) ETL for this project, i.e. only those headlines published since each source's 'high-water mark'.
+
+    :param db: connected `DatabaseManager` instance
+    :param secrets: credentials as returned by `parse_credentials()`
+    :param index: `HeadlineIndex` instance into which headlines are archived (optional)
+    :param transform_config: `TransformConfig` instance used to transform headlines (optional)
+    :param cache: `TransformCache` instance memoising transformations (optional)
+    :param dedup_sources: `DedupConfig` instance used to remove headlines syndicated across sources (optional)
+    '''
+    transform_config = transform_config or nuada.TransformConfig()
+    requesters = {'New York Times': lambda since: nuada.request_nyt_headlines_since(since, secrets['SOURCE_KEY_NYT']),
+                  'Guardian': lambda since: nuada.request_guardian_headlines_since(since, secrets['SOURCE_KEY_GUARDIAN'])}
+    headlines, watermarks = {}, {}
+    for source_alias, requester in requesters.items():
+        # NB: sources without a watermark start from the beginning of the current month
+        since = db.get_watermark(source_alias) or datetime.datetime.combine(FIRST, datetime.time.min)
+        logging.info(f'Requesting headline metadata from the "{source_alias}" published since {since}')
+        headlines[source_alias] = requester(since)
+        if headlines[source_alias].empty:
+            logging.info(f'No new headlines found for the "{source_alias}"')
+            del headlines[source_alias]
+            continue
+        # NB: watermarks reflect every headline requested, including any removed as cross-source duplicates below
+        watermarks[source_alias] = headlines[source_alias]['publication_date'].max()
+
+    headlines = deduplicate_across_sources(headlines, dedup_sources, index)
+    # NB: headlines have already been archived if they were deduplicated across sources
+    index = None if dedup_sources is not None else index
+    batch_data = {source_alias: nuada.transform(source_headlines, index, source_alias, transform_config, cache)
+                  for source_alias, source_headlines in headlines.items()}
+
+    logging.info('Merging incremental extracts from aforementioned media sources into database instance')
+    db.insert_increment(batch_data, watermarks)
+
+    return True
+
 @click.command()
 @click.option('--year', default = LATEST_PERIOD.year)
 @click.option('--month', default = LATEST_PERIOD.month)
-def exec_pipeline(year: int, month: int) -> bool:
+@click.option('--incremental', is_flag = True, default = False, help = 'Only ingest headlines published since the last run')
+@click.option('--dedup', type = click.Choice(['none', 'exact', 'near']), default = 'none', help = 'Remove duplicate headlines prior to counting')
+@click.option('--dedup-sources', type = click.Choice(['none', 'exact', 'near']), default = 'none', help = 'Remove headlines syndicated across sources prior to counting')
+def exec_pipeline(year: int, month: int, incremental: bool, dedup: str, dedup_sources: str) -> bool:
     '''
     Execute primary batch headline(s) ETL for this project.
 
     :param year: year of interest
     :param month: month of interest
+    :param incremental: whether to ingest only those headlines published since the last run (ignores `year` and `month`)
+    :param dedup: whether to remove duplicate headlines prior to counting ('none', 'exact' or 'near' duplicates)
+    :param dedup_sources: whether to remove headlines duplicated across sources prior to counting (as per `dedup`)
     '''
     logging.info('Retrieving credentials (passwords & API keys)')
     secrets = parse_credentials()
     
     logging.info('Configuring execution context')
-    batch_config = BatchConfig(year, month)
-    db_config = DatabaseConfig(db_dialect=os.environ.get('DB_DIALECT', 'sqlite'),
-                               db_api=os.environ.get('DB_API', 'pysqlite'),
-                               db_user=os.environ.get('DB_USER', ''),
-                               db_pwd=secrets['DB_PWD'],
-                               db_host=os.environ.get('DB_HOST', ''),
-                               db_port=os.environ.get('DB_PORT', ''),
-                               db_name=os.environ.get('DB_NAME', ':memory:'))
+    batch_config = nuada.BatchConfig(year, month)
+    transform_config = nuada.TransformConfig(dedup=None if dedup == 'none' else nuada.DedupConfig(near=dedup == 'near'))
+    source_dedup_config = None if dedup_sources == 'none' else nuada.DedupConfig(near=dedup_sources == 'near')
+    db_config = nuada.DatabaseConfig(db_dialect=os.environ.get('DB_DIALECT', 'sqlite'),
+                                     db_api=os.environ.get('DB_API', 'pysqlite'),
+                                     db_user=os.environ.get('DB_USER', ''),
+                                     db_pwd=secrets['DB_PWD'],
+                                     db_host=os.environ.get('DB_HOST', ''),
+                                     db_port=os.environ.get('DB_PORT', ''),
+                                     db_name=os.environ.get('DB_NAME', ':memory:'),
+                                     db_replica_host=os.environ.get('DB_REPLICA_HOST'),
+                                     db_replica_port=os.environ.get('DB_REPLICA_PORT'),
+                                     term_partition_size=int(os.environ['DB_TERM_PARTITION_SIZE']) if 'DB_TERM_PARTITION_SIZE' in os.environ else None)
     
     logging.info(f'Connecting to remote database session (config: {db_config})')
-    db = DatabaseManager(db_config)
+    db = nuada.DatabaseManager(db_config)
+
+    # NB: headlines are only archived for search purposes if an index location has been configured
+    index = nuada.HeadlineIndex(os.environ['HEADLINE_INDEX_PATH']) if 'HEADLINE_INDEX_PATH' in os.environ else None
+    # NB: likewise, transformations are only memoised (e.g. for recompute runs) if a cache location has been configured
+    cache = nuada.TransformCache(os.environ['TRANSFORM_CACHE_PATH']) if 'TRANSFORM_CACHE_PATH' in os.environ else None
+
+    if incremental:
+        return exec_increment(db, secrets, index, transform_config, cache, source_dedup_config)
     
     logging.info(f'Requesting headline metadata from the "New York Times" and the "Guardian" (config: {batch_config})')
-    headlines_nyt = request_nyt_headlines(year, month, secrets['SOURCE_KEY_NYT'])
-    headlines_guardian = request_guardian_headlines(year, month, secrets['SOURCE_KEY_GUARDIAN'])
+    headlines = {'New York Times': nuada.request_nyt_headlines(year, month, secrets['SOURCE_KEY_NYT']),
+                 'Guardian': nuada.request_guardian_headlines(year, month, secrets['SOURCE_KEY_GUARDIAN'])}
+    headlines = deduplicate_across_sources(headlines, source_dedup_config, index)
+    # NB: headlines have already been archived if they were deduplicated across sources
+    index = None if source_dedup_config is not None else index
     
     logging.info(f'Transforming headlines into term-frequency matrices')
-    terms_nyt = transform(headlines_nyt)
-    terms_guardian = transform(headlines_guardian)
-    batch_data = {'New York Times': terms_nyt,
-                  'Guardian': terms_guardian}
+    batch_data = {source_alias: nuada.transform(source_headlines, index, source_alias, transform_config, cache)
+                  for source_alias, source_headlines in headlines.items()}
     
     logging.info('Ingesting extracts from aforementioned media sources into database instance')
     db.insert_batch(batch_config, batch_data)
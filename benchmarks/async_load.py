@@ -0,0 +1,68 @@
+import click
+import os
+import sys
+import asyncio
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from nuada.db import BatchConfig, DatabaseConfig
+from nuada.db_async import AsyncDatabaseManager
+
+def _synthetic_batches(n_months: int, n_terms: int, seed: int = 0) -> list[tuple[BatchConfig, dict]]:
+    '''
+    Generate `n_months` synthetic batches, each with `n_terms` terms for two sources
+    '''
+    rng = np.random.default_rng(seed)
+    batches = []
+    for n in range(n_months):
+        year, month = 2000 + n // 12, n % 12 + 1
+        batch_data = {alias: pd.DataFrame({'term': [f'term{i}' for i in range(n_terms)],
+                                           'frequency': rng.integers(1, 100, size=n_terms)}) for alias in ('New York Times', 'Guardian')}
+        batches.append((BatchConfig(year, month), batch_data))
+    return batches
+
+def _db_config(db_name: str) -> DatabaseConfig:
+    '''
+    Configure the target database from the same environment variables as `_pipeline.py` (defaults to a temporary SQLite file)
+    '''
+    return DatabaseConfig(db_dialect=os.environ.get('DB_DIALECT', 'sqlite'),
+                          db_api=os.environ.get('DB_API', 'asyncpg'),
+                          db_user=os.environ.get('DB_USER', ''),
+                          db_pwd=os.environ.get('DB_PWD', ''),
+                          db_host=os.environ.get('DB_HOST', ''),
+                          db_port=os.environ.get('DB_PORT', ''),
+                          db_name=os.environ.get('DB_NAME', db_name))
+
+async def _load(db_config: DatabaseConfig, n_writers: int, batches: list) -> float:
+    async with AsyncDatabaseManager(db_config, n_writers=n_writers) as db:
+        start = time.perf_counter()
+        await db.insert_batches(batches)
+        return time.perf_counter() - start
+
+@click.command()
+@click.option('--months', default = 24)
+@click.option('--terms', default = 5000)
+@click.option('--writers', default = '1,2,4,8')
+def benchmark(months: int, terms: int, writers: str) -> None:
+    '''
+    Report load throughput (terms per second) of `AsyncDatabaseManager.insert_batches()` for each writer count. Each run
+    loads a disjoint range of years, so every run writes the same volume of fresh partitions.
+
+    NB: SQLite serialises writers, so scaling is only expected against a server database (e.g. PostgreSQL + asyncpg).
+    '''
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_config = _db_config(os.path.join(tmp_dir, 'nuada.db'))
+        click.echo(f'Database: {db_config}, months: {months}, terms per source: {terms}')
+        for run, n_writers in enumerate(int(n) for n in writers.split(',')):
+            batches = _synthetic_batches(months, terms)
+            for batch_config, _ in batches:
+                batch_config.year += 100 * run
+            elapsed = asyncio.run(_load(db_config, n_writers, batches))
+            click.echo(f'writers: {n_writers:>3} | elapsed: {elapsed:8.2f}s | throughput: {months * 2 * terms / elapsed:12,.0f} terms/s')
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,38 @@
+import click
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from nuada.pipeline.resources import RequestStats, _get_date_range, _request_guardian_window
+
+@click.command()
+@click.option('--year', type = int, required = True)
+@click.option('--month', type = int, required = True)
+def benchmark(year: int, month: int) -> None:
+    '''
+    Report the requests made and bytes transferred to extract one month of Guardian headlines, comparing the previous
+    configuration (50 headlines per page, sequential) against the current one (maximum page size, pages requested in
+    parallel), followed by the net change.
+
+    Requires a Guardian developer key in `SOURCE_KEY_GUARDIAN`; NB: each run counts against the key's daily allowance.
+    '''
+    key = os.environ['SOURCE_KEY_GUARDIAN']
+    start_date, end_date = _get_date_range(year, month)
+    configurations = {'previous': {'page_size': 50, 'n_workers': 1},
+                      'current': {}}
+    tallies = {}
+    for label, configuration in configurations.items():
+        stats = RequestStats()
+        start = time.perf_counter()
+        headlines_df = _request_guardian_window(start_date, end_date, key, stats=stats, **configuration)
+        elapsed = time.perf_counter() - start
+        click.echo(f'{label:>8} | headlines: {len(headlines_df):>6} | requests: {stats.n_requests:>5} | bytes: {stats.n_bytes:>12,} | elapsed: {elapsed:7.1f}s')
+        tallies[label] = (stats, elapsed)
+    (previous, previous_elapsed), (current, current_elapsed) = tallies['previous'], tallies['current']
+    click.echo(f'{"net":>8} | requests: {current.n_requests - previous.n_requests:+} ({current.n_requests / max(previous.n_requests, 1) - 1:+.0%})'
+               f' | bytes: {current.n_bytes - previous.n_bytes:+,} | elapsed: {current_elapsed - previous_elapsed:+.1f}s')
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,56 @@
+import click
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from nuada.pipeline.index import HeadlineIndex
+
+def _archive_headlines(n_years: int, n_per_month: int, seed: int = 0) -> pd.DataFrame:
+    '''
+    Generate `n_years` of synthetic monthly headlines (eight words each, drawn from a 5,000-word vocabulary whose word
+    frequencies follow Zipf's law, so that `word0` is the most common), published hourly through each month
+    '''
+    rng = np.random.default_rng(seed)
+    vocabulary = np.array([f'word{n}' for n in range(5000)])
+    weights = 1 / np.arange(1, len(vocabulary) + 1)
+    months = pd.date_range('2010-01-01', periods=n_years * 12, freq='MS', tz='UTC').repeat(n_per_month)
+    dates = months + pd.to_timedelta(np.tile(np.arange(n_per_month) % 672, n_years * 12), unit='h')
+    headlines = [' '.join(words) for words in rng.choice(vocabulary, size=(len(dates), 8), p=weights / weights.sum())]
+    headlines_df = pd.DataFrame({'publication_date': dates, 'headline': headlines})
+    headlines_df['year'] = headlines_df['publication_date'].dt.year
+    headlines_df['month'] = headlines_df['publication_date'].dt.month
+    return headlines_df
+
+@click.command()
+@click.option('--years', default = 10)
+@click.option('--headlines', default = 500, help = 'Headlines per month')
+@click.option('--terms', default = 20, help = 'Number of (most common) terms looked up')
+def benchmark(years: int, headlines: int, terms: int) -> None:
+    '''
+    Report the latency of `HeadlineIndex.search()` over a synthetic archive, for lookups of the most common terms (i.e.
+    those matching the most headlines) restricted to a month, a year and no period. Each lookup is warmed up once before
+    being timed; the median and 95th percentile are reported.
+    '''
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        index = HeadlineIndex(os.path.join(tmp_dir, 'headlines.db'))
+        start = time.perf_counter()
+        n_indexed = index.add('Guardian', _archive_headlines(years, headlines))
+        click.echo(f'Indexed {n_indexed:,} headlines in {time.perf_counter() - start:.1f}s')
+        scopes = {'month': {'year': 2010 + years // 2, 'month': 6}, 'year': {'year': 2010 + years // 2}, 'all': {}}
+        for label, scope in scopes.items():
+            elapsed = []
+            for term in (f'word{n}' for n in range(terms)):
+                index.search(term, source_alias='Guardian', **scope)
+                start = time.perf_counter()
+                index.search(term, source_alias='Guardian', **scope)
+                elapsed.append(time.perf_counter() - start)
+            click.echo(f'{label:>5} | median: {1000 * np.median(elapsed):7.2f}ms | p95: {1000 * np.percentile(elapsed, 95):7.2f}ms')
+        index.close()
+
+if __name__ == '__main__':
+    benchmark()
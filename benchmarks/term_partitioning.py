@@ -0,0 +1,108 @@
+import click
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from sqlalchemy import text
+from nuada.db import BatchConfig, DatabaseConfig, DatabaseManager, _term_partition_bounds
+
+# NB: each query is parametrised by a year (and month) drawn at random from the synthetic load
+QUERIES = {
+    'month': '''SELECT t.term, t.frequency FROM term t JOIN control c ON c.control_id = t.control_id
+                WHERE c.year = :year AND c.month = :month''',
+    'month (by id)': '''SELECT t.term, t.frequency FROM term t
+                        WHERE t.control_id = (SELECT control_id FROM control WHERE year = :year AND month = :month)''',
+    'year totals': '''SELECT t.term, SUM(t.frequency) FROM term t JOIN control c ON c.control_id = t.control_id
+                      WHERE c.year = :year GROUP BY t.term''',
+    'term series': '''SELECT c.year, c.month, SUM(t.frequency) FROM term t JOIN control c ON c.control_id = t.control_id
+                      WHERE t.term = 'term42' GROUP BY c.year, c.month''',
+}
+
+def _db_config(db_name: str, term_partition_size: int | None) -> DatabaseConfig:
+    '''
+    Configure the target (PostgreSQL) database from the same environment variables as `_pipeline.py`
+    '''
+    return DatabaseConfig(db_dialect='postgresql',
+                          db_api=os.environ.get('DB_API', 'psycopg2'),
+                          db_user=os.environ.get('DB_USER', 'postgres'),
+                          db_pwd=os.environ.get('DB_PWD', ''),
+                          db_host=os.environ.get('DB_HOST', 'localhost'),
+                          db_port=os.environ.get('DB_PORT', '5432'),
+                          db_name=db_name,
+                          term_partition_size=term_partition_size)
+
+def _load(db: DatabaseManager, n_years: int, n_terms: int, seed: int = 0) -> float:
+    '''
+    Load `n_years` of synthetic monthly batches (Zipf-distributed frequencies over `n_terms` terms for two sources); months
+    which are already loaded are skipped, so re-runs only measure queries
+    '''
+    rng = np.random.default_rng(seed)
+    terms = np.array([f'term{n}' for n in range(n_terms)], dtype=object)
+    start = time.perf_counter()
+    for n in range(n_years * 12):
+        batch_data = {alias: pd.DataFrame({'term': terms, 'frequency': rng.zipf(1.5, size=n_terms).clip(max=10 ** 6)})
+                      for alias in ('New York Times', 'Guardian')}
+        db.insert_batch(BatchConfig(2000 + n // 12, n % 12 + 1, commentary='Benchmark', chunk_size=10000), batch_data)
+    return time.perf_counter() - start
+
+def _time_queries(db: DatabaseManager, n_years: int, n_repeats: int, seed: int = 0) -> dict[str, float]:
+    '''
+    Median elapsed time (in milliseconds) of each query in `QUERIES` over `n_repeats` random periods
+    '''
+    rng = np.random.default_rng(seed)
+    periods = [(2000 + int(rng.integers(n_years)), int(rng.integers(1, 13))) for _ in range(n_repeats)]
+    timings = {}
+    for label, query in QUERIES.items():
+        elapsed = []
+        for year, month in periods:
+            start = time.perf_counter()
+            db.read_session.execute(text(query), {'year': year, 'month': month}).all()
+            elapsed.append(time.perf_counter() - start)
+        db.read_session.rollback()
+        timings[label] = 1000 * float(np.median(elapsed))
+    return timings
+
+def _time_vacuum(db: DatabaseManager, n_years: int) -> float:
+    '''
+    Elapsed time (in seconds) of `VACUUM ANALYZE` for the table (or partition) holding the most recent year; NB: for the
+    unpartitioned table this is necessarily the whole table
+    '''
+    table = 'term'
+    if db.term_partition_size:
+        lower, upper = _term_partition_bounds(n_years * 12, db.term_partition_size)
+        table = f'term_{lower}_{upper - 1}'
+    with db.db_session.get_bind().connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        start = time.perf_counter()
+        connection.execute(text(f'VACUUM ANALYZE {table}'))
+        return time.perf_counter() - start
+
+@click.command()
+@click.option('--years', default = 20)
+@click.option('--terms', default = 20000)
+@click.option('--repeats', default = 20)
+@click.option('--partition-size', default = 12)
+@click.option('--plain-db', default = 'nuada_bench_plain')
+@click.option('--partitioned-db', default = 'nuada_bench_partitioned')
+def benchmark(years: int, terms: int, repeats: int, partition_size: int, plain_db: str, partitioned_db: str) -> None:
+    '''
+    Compare query (and vacuum) times for an unpartitioned `term` table against one partitioned by ranges of `control_id`,
+    each holding the same synthetic load (`years` x 12 months x 2 sources x `terms` terms).
+
+    Requires a PostgreSQL server (configured via `DB_USER`, `DB_PWD`, `DB_HOST` and `DB_PORT`) on which both databases
+    already exist (e.g. `createdb nuada_bench_plain && createdb nuada_bench_partitioned`); the first run loads them.
+    '''
+    for label, db_name, term_partition_size in (('plain', plain_db, None), ('partitioned', partitioned_db, partition_size)):
+        db = DatabaseManager(_db_config(db_name, term_partition_size))
+        elapsed = _load(db, years, terms)
+        with db.db_session.get_bind().connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+            connection.execute(text('ANALYZE'))
+        click.echo(f'{label:>11} | load: {elapsed:8.1f}s | vacuum (latest year): {_time_vacuum(db, years):6.2f}s')
+        for query, median in _time_queries(db, years, repeats).items():
+            click.echo(f'{label:>11} | {query:>13}: {median:9.2f}ms (median of {repeats})')
+
+if __name__ == '__main__':
+    benchmark()
@@ -1,7 +1,44 @@
 '''
 A pipeline module dedicated to extracting data from freely available news outlet APIs (e.g. the New York Times and the Guardian) to understand topic frequencies & trends.
+
+Public names are resolved lazily (i.e. on first attribute access) so that importing the package does not pay for
+`pandas`, `nltk` and `sqlalchemy` until they are actually required.
 '''
 
-from .pipeline.transformer import transform
-from .pipeline.resources import request_guardian_headlines, request_nyt_headlines
-from .db import DatabaseConfig, DatabaseManager, BatchConfig
\ No newline at end of file
+import importlib
+
+_LAZY_ATTRIBUTES = {
+    'transform': '.pipeline.transformer',
+    'sketch_terms': '.pipeline.transformer',
+    'TransformConfig': '.pipeline.transformer',
+    'Lexicon': '.pipeline.transformer',
+    'DedupConfig': '.pipeline.dedup',
+    'deduplicate_headlines': '.pipeline.dedup',
+    'deduplicate_sources': '.pipeline.dedup',
+    'SketchConfig': '.pipeline.sketch',
+    'TermSketch': '.pipeline.sketch',
+    'HeadlineIndex': '.pipeline.index',
+    'TransformCache': '.pipeline.cache',
+    'request_guardian_headlines': '.pipeline.resources',
+    'request_nyt_headlines': '.pipeline.resources',
+    'request_guardian_headlines_since': '.pipeline.resources',
+    'request_nyt_headlines_since': '.pipeline.resources',
+    'RequestStats': '.pipeline.resources',
+    'DatabaseConfig': '.db',
+    'DatabaseManager': '.db',
+    'BatchConfig': '.db',
+    'AsyncDatabaseManager': '.db_async',
+    'TermMatrix': '.matrix',
+}
+
+__all__ = list(_LAZY_ATTRIBUTES)
+
+def __getattr__(name: str):
+    if name not in _LAZY_ATTRIBUTES:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    value = getattr(importlib.import_module(_LAZY_ATTRIBUTES[name], __name__), name)
+    globals()[name] = value # NB: cache on the module so that subsequent lookups bypass `__getattr__`
+    return value
+
+def __dir__() -> list[str]:
+    return sorted(list(globals()) + __all__)
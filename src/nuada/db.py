@@ -1,16 +1,35 @@
-import pandas as pd
+from __future__ import annotations
+
+import hashlib
 import logging
 
-from datetime import datetime
-from dataclasses import dataclass
-from sqlalchemy import create_engine, URL, select, update
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from dataclasses import dataclass, replace
+from typing import TYPE_CHECKING, Iterator
+from sqlalchemy import create_engine, URL, Connection, TextClause, Update, delete, select, text, update
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import Session
-from .models import Base, Control, Term, Source
+from .models import Base, Control, Term, Source, Progress, Watermark, Sketch
+
+if TYPE_CHECKING:
+    # NB: `pandas` (and, by extension, the sketching module) is only needed once data is loaded, so it is not imported eagerly
+    import pandas as pd
+    from .pipeline.sketch import TermSketch
+    from .matrix import TermMatrix
+
+CLAIMABLE_STATUSES = ('In Progress', 'Fatal', 'Incremental') # NB: i.e. months which are neither complete nor currently claimed by another loader
+CLAIM_LEASE = timedelta(minutes=30) # NB: a claim which has not been renewed for this long (e.g. its loader crashed) may be taken over
 
 @dataclass
 class DatabaseConfig:
     '''
     Configure the parameters for a remote SQL database connection
+
+    :param db_replica_host: Host of a read replica to which read-only queries are routed (see `DatabaseManager.read_session`); defaults to `None` (i.e. reads go to the primary)
+    :param db_replica_port: Port of the read replica; defaults to `db_port`
+    :param term_partition_size: Number of `control` records (i.e. months) per partition of the `term` table, e.g. 12 for
+                                roughly one partition per year; PostgreSQL only and defaults to `None` (i.e. unpartitioned)
     '''
     db_dialect: str = 'sqlite'
     db_api: str = 'pysqlite'
@@ -20,6 +39,9 @@ class DatabaseConfig:
     db_port: str | None = ''
     db_name: str = ':memory:'
     echo: bool = False
+    db_replica_host: str | None = None
+    db_replica_port: str | None = None
+    term_partition_size: int | None = None
 
     def __repr__(self) -> str:
         return f'(Database: {self.db_dialect}, Name: {self.db_name})'
@@ -32,51 +54,200 @@ class BatchConfig:
     :param year: Year of batch upload
     :param month: Month of batch upload
     :param commentary: String identifier for the batch run description
-    :param resource_extracts: Set of `pd.DataFrame` objects identifying different source extracts (e.g. 'New York Times')
+    :param chunk_size: Number of terms committed per transaction; a failed run resumes from the last committed chunk
     '''
     year: int
     month: int
     commentary: str = 'Production'
+    chunk_size: int = 1000
 
     def __repr__(self) -> str:
         return f'(Period (Yyyy/Mm): {self.year}/{self.month}, Commentary: {self.commentary})'
     
 
-def _init_db_session(db_config: DatabaseConfig = DatabaseConfig()) -> Session:
+def _build_db_url(db_config: DatabaseConfig, asynchronous: bool = False) -> str | URL:
     '''
-    Initialise a database 'session' for operating on the remote database. This abstraction essentially encapsulates a pool of database connections.
+    Build the connection URL for the database described by `db_config`. For non-SQLite databases, an asynchronous
+    connection requires an asynchronous `db_api` to be configured (e.g. 'asyncpg').
 
-    This function will initialise the schema for this database if it has not been created in the target database already.
+    :param db_config: Object of class `DatabaseConfig`
+    :param asynchronous: Whether the URL is destined for an asynchronous engine (i.e. SQLite is served by 'aiosqlite')
     '''
-    # Configure database parameters
     if db_config.db_dialect.lower() == 'sqlite':
         # For SQLite, handle the URL format differently
-        db_url = f'{db_config.db_dialect}:///{db_config.db_name}'
-    else:
-        # For other databases
-        engine_config = {
-            'drivername': f'{db_config.db_dialect}+{db_config.db_api}',
-            'username': f'{db_config.db_user}',
-            'password': f'{db_config.db_pwd}',
-            'host': f'{db_config.db_host}',
-            'database': f'{db_config.db_name}'
-        }
-        if db_config.db_port:
-            engine_config['port'] = db_config.db_port
-        db_url = URL.create(**engine_config)
+        driver = '+aiosqlite' if asynchronous else ''
+        return f'{db_config.db_dialect}{driver}:///{db_config.db_name}'
+    # For other databases
+    engine_config = {
+        'drivername': f'{db_config.db_dialect}+{db_config.db_api}',
+        'username': f'{db_config.db_user}',
+        'password': f'{db_config.db_pwd}',
+        'host': f'{db_config.db_host}',
+        'database': f'{db_config.db_name}'
+    }
+    if db_config.db_port:
+        engine_config['port'] = db_config.db_port
+    return URL.create(**engine_config)
+
+# NB: PostgreSQL requires the partition key (`control_id`) to be part of every unique constraint on a partitioned table
+_PARTITIONED_TERM_DDL = '''
+CREATE TABLE IF NOT EXISTS term (
+    term_id SERIAL,
+    term TEXT NOT NULL,
+    source_id INTEGER REFERENCES source (source_id),
+    control_id INTEGER NOT NULL REFERENCES control (control_id),
+    frequency INTEGER NOT NULL,
+    PRIMARY KEY (term_id, control_id),
+    CONSTRAINT _uc_term_source_control UNIQUE (term, source_id, control_id)
+) PARTITION BY RANGE (control_id)
+'''
+
+def _create_schema(connection: Connection, term_partition_size: int | None = None) -> bool:
+    '''
+    Create any tables missing from the target database; returns whether the `term` table is partitioned.
+
+    If `term_partition_size` is set (PostgreSQL only), the `term` table is created as a table partitioned by ranges of
+    `control_id`; its partitions are created on demand (see `_term_partition_statements()`). NB: an existing unpartitioned
+    `term` table is left as is, i.e. it must be migrated by hand.
+
+    :param connection: Object of class `Connection`
+    :param term_partition_size: Number of `control` records per partition of the `term` table
+    '''
+    if not term_partition_size:
+        Base.metadata.create_all(connection)
+        return False
+    if connection.dialect.name != 'postgresql':
+        logging.warning(f'Partitioning of the `term` table is not supported for dialect "{connection.dialect.name}"; ignoring')
+        Base.metadata.create_all(connection)
+        return False
+    Base.metadata.create_all(connection, tables=[table for table in Base.metadata.sorted_tables if table is not Term.__table__])
+    connection.execute(text(_PARTITIONED_TERM_DDL))
+    partitioned = connection.execute(text("SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'term'::regclass)")).scalar()
+    if not partitioned:
+        logging.warning('Table `term` already exists and is not partitioned; partitioning is disabled until it is migrated')
+    return partitioned
+
+def _term_partition_bounds(control_id: int, term_partition_size: int) -> tuple[int, int]:
+    '''
+    Range of `control_id` values (lower bound inclusive, upper bound exclusive) covered by the `term` partition holding `control_id`
+    '''
+    lower = (control_id - 1) // term_partition_size * term_partition_size + 1
+    return lower, lower + term_partition_size
+
+def _term_partition_statements(control_id: int, term_partition_size: int) -> list[TextClause]:
+    '''
+    Statements creating the `term` partition which holds `control_id` if it does not already exist. NB: concurrent loaders
+    may need the same partition, so its creation is serialised with a (transaction-scoped) advisory lock.
+    '''
+    lower, upper = _term_partition_bounds(control_id, term_partition_size)
+    return [text("SELECT pg_advisory_xact_lock(hashtext('nuada.term_partition'))"),
+            text(f'CREATE TABLE IF NOT EXISTS term_{lower}_{upper - 1} PARTITION OF term FOR VALUES FROM ({lower}) TO ({upper})')]
+
+def _prepare_terms(terms_df: pd.DataFrame) -> tuple[list[dict], str]:
+    '''
+    Sort an extract of terms (so that chunk offsets are stable between retries) and compute its digest (so that a retry only
+    resumes part way through an *identical* extract); returns the sorted records and the digest
+
+    :param terms_df: Object of class `pd.DataFrame` with fields: `term` and `frequency`
+    '''
+    import pandas as pd
+    terms_df = terms_df.sort_values('term', kind='stable')
+    digest = hashlib.sha256(pd.util.hash_pandas_object(terms_df[['term', 'frequency']], index=False).to_numpy().tobytes()).hexdigest()
+    return terms_df.to_dict(orient='records'), digest
+
+def _claimable(status: str, timestamp: datetime) -> bool:
+    '''
+    Whether a `control` record with the given status and timestamp may be claimed by a loader, i.e. it is neither complete
+    nor claimed by another loader whose lease (see `CLAIM_LEASE`) is still current
+    '''
+    return status in CLAIMABLE_STATUSES or (status == 'Loading' and timestamp < datetime.now() - CLAIM_LEASE)
+
+def _claim_statement(control_id: int, status: str, timestamp: datetime) -> Update:
+    '''
+    Statement moving a `control` record to status 'Loading'; it only applies if the record is unchanged since it was read
+    (i.e. the status and timestamp guards make the claim safe even where `FOR UPDATE` is not supported, e.g. SQLite)
+    '''
+    return (update(Control)
+                .where(Control.control_id == control_id, Control.status == status, Control.timestamp == timestamp)
+                .values(status='Loading', timestamp=datetime.now()))
+
+def _renew_statement(control_id: int) -> Update:
+    '''
+    Statement renewing the lease on a claimed `control` record; issued with every chunk committed so that a long load is not taken over
+    '''
+    return update(Control).where(Control.control_id == control_id, Control.status == 'Loading').values(timestamp=datetime.now())
+
+def _init_db_session(db_config: DatabaseConfig = DatabaseConfig(), init_schema: bool = True) -> Session:
+    '''
+    Initialise a database 'session' for operating on the remote database. This abstraction essentially encapsulates a pool of database connections.
+
+    This function will initialise the schema for this database if it has not been created in the target database already
+    (unless `init_schema` is `False`, e.g. for a read replica).
+    '''
+    # Configure database parameters
+    db_url = _build_db_url(db_config)
 
     # Initialise connection pool ('engine')
     engine = create_engine(url=db_url, echo=db_config.echo)
-    Base.metadata.create_all(engine)
+    db_session = Session(engine)
+    if init_schema:
+        with engine.begin() as connection:
+            partitioned = _create_schema(connection, db_config.term_partition_size)
+        # NB: recorded on the session so that loaders know whether `term` partitions must be maintained
+        db_session.info['term_partition_size'] = db_config.term_partition_size if partitioned else None
     
-    return Session(engine)
+    return db_session
 
 class DatabaseManager():
     '''
     Repository pattern for efficient and secure database interactions. With this abstraction you can load headline terms into the database.
+
+    Writes always go to the primary (`db_session`); read-only queries go to `read_session`, which is bound to the read
+    replica if one is configured (see `DatabaseConfig`) and is otherwise the primary session. NB: a replica may lag the
+    primary, so anything which informs a write (e.g. `get_watermark()`) is read from the primary.
+
+    :param database_config: Object of class `DatabaseConfig`
+    :param term_matrix: Object of class `TermMatrix` which is updated whenever a batch completes or an increment is merged; defaults to `None` (i.e. no materialisation)
     '''
-    def __init__(self, database_config: DatabaseConfig):
+    def __init__(self, database_config: DatabaseConfig, term_matrix: TermMatrix | None = None):
         self.db_session = _init_db_session(database_config)
+        self.term_matrix = term_matrix
+        self.term_partition_size = self.db_session.info['term_partition_size']
+        self._term_partitions = set()
+        if database_config.db_replica_host:
+            replica_config = replace(database_config,
+                                     db_host=database_config.db_replica_host,
+                                     db_port=database_config.db_replica_port or database_config.db_port)
+            self.read_session = _init_db_session(replica_config, init_schema=False)
+        else:
+            self.read_session = self.db_session
+
+    @contextmanager
+    def _reading(self) -> Iterator[Session]:
+        '''
+        Session for read-only queries; where this is a replica, the read transaction is ended afterwards so that it does not hold back the replica
+        '''
+        try:
+            yield self.read_session
+        finally:
+            if self.read_session is not self.db_session:
+                self.read_session.rollback()
+
+    def _ensure_term_partition(self, control_id: int) -> None:
+        '''
+        Create the `term` partition which holds `control_id` if the table is partitioned and the partition does not already exist
+
+        :param control_id: Integer identifying the control record
+        '''
+        if not self.term_partition_size:
+            return
+        lower, _ = _term_partition_bounds(control_id, self.term_partition_size)
+        if lower in self._term_partitions:
+            return
+        for stmt in _term_partition_statements(control_id, self.term_partition_size):
+            self.db_session.execute(stmt)
+        self.db_session.commit()
+        self._term_partitions.add(lower)
 
     def _insert_control(self, year: int, month: int, commentary: str = 'Production') -> int:
         '''
@@ -97,8 +268,31 @@ class DatabaseManager():
         else:
             control_status = res[0].status
             control_id = res[0].control_id
+        self._ensure_term_partition(control_id)
         return control_id, control_status
     
+    def _claim_control(self, year: int, month: int, commentary: str = 'Production') -> tuple[int, str, bool]:
+        '''
+        Claim the `control` record for a given period for loading (registering it if need be): the record is locked
+        (`SELECT ... FOR UPDATE`) and moved to status 'Loading' in a single transaction, so two loaders (synchronous or
+        asynchronous) can never claim the same month. Returns the control identifier, its status prior to the claim and
+        whether it was claimed.
+
+        :param year: Integer year of extraction
+        :param month: Integer month of extraction
+        :param commentary: String description for the pipeline being administered (defaults to 'Production')
+        '''
+        insert = self._dialect_insert()
+        self.db_session.execute(insert(Control)
+                                    .values(year=year, month=month, commentary=commentary, status='In Progress', timestamp=datetime.now())
+                                    .on_conflict_do_nothing(index_elements=[Control.year, Control.month]))
+        stmt = select(Control.control_id, Control.status, Control.timestamp).where(Control.year == year, Control.month == month).with_for_update()
+        control_id, control_status, timestamp = self.db_session.execute(stmt).one()
+        claimed = _claimable(control_status, timestamp) and self.db_session.execute(_claim_statement(control_id, control_status, timestamp)).rowcount == 1
+        self.db_session.commit()
+        self._ensure_term_partition(control_id)
+        return control_id, control_status, claimed
+
     def _update_control(self, control_id: int, status: str, commentary: str) -> None:
         '''
         Update `control` record in the database
@@ -108,9 +302,23 @@ class DatabaseManager():
         '''
         resolution = update(Control).where(Control.control_id == control_id).values(timestamp=datetime.now(), 
                                                                                     status=status, 
-                                                                                    commentary=commentary)
+                                                                                    commentary=commentary[:100])
         self.db_session.execute(resolution)
     
+    def _mark_incremental(self, control_id: int, commentary: str) -> bool:
+        '''
+        Move a `control` record to status 'Incremental', provided it is still claimable (i.e. it is neither complete nor
+        claimed by a batch load); returns whether it was updated. NB: the update also locks the record until the increment
+        commits, so a batch cannot claim the month part way through.
+
+        :param control_id: Integer identifier for the control record to be updated
+        :param commentary: String description for the pipeline being administered
+        '''
+        res = self.db_session.execute(update(Control)
+                                          .where(Control.control_id == control_id, Control.status.in_(CLAIMABLE_STATUSES))
+                                          .values(timestamp=datetime.now(), status='Incremental', commentary=commentary[:100]))
+        return res.rowcount == 1
+
     def _insert_source(self, alias: str) -> int:
         '''
         Insert `source` record into the database (e.g. 'New York Times'); if source with `alias` already exists, the corresponding ID is returned instead
@@ -128,73 +336,286 @@ class DatabaseManager():
             source_id = res[0].source_id
         return source_id
 
-    def _insert_term(self, token: str, frequency: int, source_id: int, control_id: int) -> int:
+    def _dialect_insert(self):
+        '''
+        Resolve the dialect-specific `insert()` construct (i.e. one which supports `ON CONFLICT` clauses) for the bound database
+        '''
+        dialect = self.db_session.get_bind().dialect.name
+        if dialect == 'postgresql':
+            return postgresql.insert
+        elif dialect == 'sqlite':
+            return sqlite.insert
+        raise NotImplementedError(f'Conflict resolution is not supported for dialect "{dialect}"')
+
+    def _get_progress(self, source_id: int, control_id: int, digest: str) -> int:
         '''
-        Insert an individual term (`token`) and frequency into the database
+        Retrieve the number of terms already committed for this source and control from the extract identified by `digest`.
+        If nothing has been committed from this extract (e.g. headlines have since been requested afresh, or the month was
+        previously loaded incrementally), the terms recorded for this source and control are discarded and loading restarts.
 
-        :param token: String identifying the term of interest
-        :param frequency: Integer indicating the frequency that the term had been observed for this control and source
         :param source_id: Integer identifying the source record
         :param control_id: Integer identifying the control record
+        :param digest: Digest of the extract being loaded (see `_prepare_terms()`)
         '''
-        stmt = select(Term).where(Term.term == token, Term.control_id == control_id)
-        res = self.db_session.execute(stmt).first()
-        if not res:
-            term = Term(term=token,
-                        source_id=source_id,
-                        control_id=control_id,
-                        frequency=frequency)
-            self.db_session.add(term)
-            self.db_session.flush()
-            term_id = term.term_id
-        else:
-            term_id = res[0].term_id
-        return term_id
+        progress = self.db_session.get(Progress, (control_id, source_id))
+        if progress is not None and progress.digest == digest:
+            return progress.n_terms
+        self.db_session.execute(delete(Term).where(Term.source_id == source_id, Term.control_id == control_id))
+        self.db_session.merge(Progress(control_id=control_id, source_id=source_id, n_terms=0, digest=digest))
+        self.db_session.commit()
+        return 0
     
-    def _insert_terms(self, terms_df: pd.DataFrame, source_id: int, control_id: int) -> None:
+    def _insert_terms(self, terms_df: pd.DataFrame, source_id: int, control_id: int, chunk_size: int = 1000) -> None:
+        '''
+        Insert *multiple* terms and associated frequencies into the database, committing every `chunk_size` terms. Each chunk is
+        written within a savepoint alongside the source's progress, so a failure discards only the chunk in flight and a retry
+        of the same extract resumes from the last committed chunk (whereas a different extract replaces the terms recorded).
+
+        :param terms_df: Object of class `pd.DataFrame` with fields: `term` and `frequency`
+        :param source_id: Integer identifying the source record
+        :param control_id: Integer identifying the control record
+        :param chunk_size: Number of terms committed per transaction
+        '''
+        terms_dict, digest = _prepare_terms(terms_df)
+        insert = self._dialect_insert()
+        stmt = insert(Term).on_conflict_do_nothing(index_elements=[Term.term, Term.source_id, Term.control_id])
+        for offset in range(self._get_progress(source_id, control_id, digest), len(terms_dict), chunk_size):
+            chunk = terms_dict[offset:offset + chunk_size]
+            with self.db_session.begin_nested():
+                self.db_session.execute(stmt, [{'term': record['term'],
+                                                'frequency': int(record['frequency']),
+                                                'source_id': source_id,
+                                                'control_id': control_id} for record in chunk])
+                self.db_session.execute(update(Progress)
+                                            .where(Progress.source_id == source_id, Progress.control_id == control_id)
+                                            .values(n_terms=offset + len(chunk)))
+                self.db_session.execute(_renew_statement(control_id))
+            self.db_session.commit()
+
+    def _upsert_terms(self, terms_df: pd.DataFrame, source_id: int, control_id: int) -> None:
         '''
-        Insert *multiple* terms and associated frequencies into the database
+        Merge *multiple* terms and associated frequencies into the database; where a term has already been recorded for this
+        source and control, its frequency is incremented atomically (i.e. `INSERT ... ON CONFLICT DO UPDATE`)
 
         :param terms_df: Object of class `pd.DataFrame` with fields: `term` and `frequency`
         :param source_id: Integer identifying the source record
         :param control_id: Integer identifying the control record
         '''
-        terms_dict = terms_df.to_dict(orient='records')
-        for record in terms_dict:
-            self._insert_term(token=record['term'], 
-                             frequency=record['frequency'], 
-                             source_id=source_id, 
-                             control_id=control_id)
+        insert = self._dialect_insert()
+        records = [{'term': record['term'],
+                    'frequency': int(record['frequency']),
+                    'source_id': source_id,
+                    'control_id': control_id} for record in terms_df.to_dict(orient='records')]
+        if not records:
+            return
+        stmt = insert(Term)
+        stmt = stmt.on_conflict_do_update(index_elements=[Term.term, Term.source_id, Term.control_id],
+                                          set_={'frequency': Term.frequency + stmt.excluded.frequency})
+        self.db_session.execute(stmt, records)
+
+    def get_watermark(self, alias: str) -> datetime | None:
+        '''
+        Retrieve the 'high-water mark' (i.e. latest publication timestamp ingested) for the source identified by `alias`
+
+        :param alias: A string-based description of the media source
+        '''
+        stmt = select(Watermark.published).join(Source, Source.source_id == Watermark.source_id).where(Source.alias == alias)
+        return self.db_session.execute(stmt).scalar()
+
+    def _update_watermark(self, source_id: int, published: datetime) -> None:
+        '''
+        Advance the 'high-water mark' for the source identified by `source_id`
+
+        :param source_id: Integer identifying the source record
+        :param published: Timestamp of the latest headline ingested (stored as naive UTC)
+        '''
+        import pandas as pd
+        published = pd.Timestamp(published)
+        if published.tzinfo is not None:
+            published = published.tz_convert('UTC').tz_localize(None)
+        self.db_session.merge(Watermark(source_id=source_id, published=published.to_pydatetime()))
 
     def insert_batch(self, batch_config: BatchConfig, batch_data: dict[pd.DataFrame]) -> int:
         '''
         Inserts a batch of terms (`terms_df`) into the database instance. Parameter `batch_config` is used
         to parametrise the batch run settings.
 
-        :param terms_df: Object of class `pd.DataFrame` with fields: `term` and `frequency`
+        The month is first claimed (see `_claim_control()`), so it is skipped if it is complete or being loaded elsewhere.
+        Each source is loaded in isolation (see `_insert_terms()`): a failing source marks the batch as 'Fatal' without
+        discarding the terms committed for the others, and re-running the batch resumes each source where it left off. A month
+        previously loaded incrementally (i.e. with status 'Incremental') is finalised: the partial counts of each source are
+        replaced by those in `batch_data`.
+
         :param batch_config: Object of class `BatchConfig`
+        :param batch_data: Dictionary of `pd.DataFrame` objects (keyed by source alias) with fields: `term` and `frequency`
         '''
-        control_id, control_status = self._insert_control(batch_config.year, batch_config.month, batch_config.commentary)
-        if control_status == 'Success':
+        control_id, control_status, claimed = self._claim_control(batch_config.year, batch_config.month, batch_config.commentary)
+        if not claimed:
+            if control_status != 'Success':
+                # NB: the month has been claimed by a concurrent loader (see `_claim_control()`)
+                logging.warning(f'Batch {batch_config} is already being loaded elsewhere; skipping')
             return control_id
-        try:
-            source_aliases = batch_data.keys()
-            for source_alias in source_aliases:
+        failures = []
+        for source_alias, source_terms_df in batch_data.items():
+            # NB: generic `Exception` is not always a good practice but for the purposes of logging (below) it arguably makes sense
+            try:
                 source_id = self._insert_source(source_alias)
-                source_terms_df = batch_data.get(source_alias)
                 self._insert_terms(terms_df=source_terms_df,
-                                  control_id=control_id,
-                                  source_id=source_id)
-            self._update_control(control_id, 'Success', 'Production')
-        # NB: generic `Exception` is not always a good practice but for the purposes of logging (below) it arguably makes sense
+                                   control_id=control_id,
+                                   source_id=source_id,
+                                   chunk_size=batch_config.chunk_size)
+            except Exception as err:
+                logging.error(f'Failed to load terms for source "{source_alias}": {err}')
+                self.db_session.rollback()
+                failures.append(f'{source_alias}: {err}')
+            finally:
+                # NB: release the (already committed) ORM state so that large batches do not accumulate in the identity map
+                self.db_session.expunge_all()
+        if failures:
+            self._update_control(control_id, 'Fatal', '; '.join(failures))
+        else:
+            self._update_control(control_id, 'Success', batch_config.commentary)
+        self.db_session.commit()
+        if not failures and self.term_matrix is not None:
+            self.term_matrix.update(batch_config.year, batch_config.month, batch_data)
+        return control_id
+
+    def insert_sketch(self, batch_config: BatchConfig, source_alias: str, term_sketch: TermSketch, replace: bool = False) -> int:
+        '''
+        Inserts approximate term counts (`term_sketch`) for a given source into the database instance. If a sketch has already
+        been recorded for this source and period, the two are merged (e.g. when streaming pages or increments) unless `replace`
+        is specified, in which case it is overwritten (e.g. for a full month, so that re-running the month does not double count).
+
+        NB: the recorded sketch is locked (`SELECT ... FOR UPDATE`) whilst it is merged, so concurrent writers do not lose each other's counts.
+
+        :param batch_config: Object of class `BatchConfig`
+        :param source_alias: A string-based description of the media source
+        :param term_sketch: Object of class `TermSketch`
+        :param replace: Whether `term_sketch` replaces (rather than merges into) any sketch already recorded; defaults to `False`
+        '''
+        from .pipeline.sketch import TermSketch
+        control_id, _ = self._insert_control(batch_config.year, batch_config.month, batch_config.commentary)
+        try:
+            source_id = self._insert_source(source_alias)
+            insert = self._dialect_insert()
+            res = self.db_session.execute(insert(Sketch)
+                                              .values(source_id=source_id, control_id=control_id, payload=term_sketch.to_bytes())
+                                              .on_conflict_do_nothing(index_elements=[Sketch.source_id, Sketch.control_id]))
+            if res.rowcount != 1:
+                stmt = select(Sketch.payload).where(Sketch.source_id == source_id, Sketch.control_id == control_id).with_for_update()
+                payload = term_sketch if replace else TermSketch.from_bytes(self.db_session.execute(stmt).scalar_one()).merge(term_sketch)
+                self.db_session.execute(update(Sketch)
+                                            .where(Sketch.source_id == source_id, Sketch.control_id == control_id)
+                                            .values(payload=payload.to_bytes()))
+            self.db_session.commit()
         except Exception as err:
             logging.error(err)
             self.db_session.rollback()
-            self._update_control(control_id, 'Fatal', str(err))
-        finally:
-            self.db_session.flush()
-            self.db_session.commit()
+            raise err
         return control_id
+
+    def get_sketch(self, year: int, month: int, source_alias: str | None = None) -> TermSketch | None:
+        '''
+        Retrieve the approximate term counts for a given period, merged across all sources unless `source_alias` is specified
+
+        :param year: Integer year of extraction
+        :param month: Integer month of extraction
+        :param source_alias: A string-based description of the media source; defaults to `None` (i.e. all sources)
+        '''
+        from .pipeline.sketch import TermSketch
+        stmt = (select(Sketch.payload)
+                    .join(Control, Control.control_id == Sketch.control_id)
+                    .join(Source, Source.source_id == Sketch.source_id)
+                    .where(Control.year == year, Control.month == month))
+        if source_alias is not None:
+            stmt = stmt.where(Source.alias == source_alias)
+        term_sketch = None
+        with self._reading() as read_session:
+            payloads = read_session.execute(stmt).scalars().all()
+        for payload in payloads:
+            sketch = TermSketch.from_bytes(payload)
+            term_sketch = sketch if term_sketch is None else term_sketch.merge(sketch)
+        return term_sketch
+
+    def get_terms(self, year: int, month: int, source_alias: str | None = None) -> pd.DataFrame:
+        '''
+        Retrieve the terms (and their frequencies) recorded for a given period, for all sources unless `source_alias` is specified
+
+        :param year: Integer year of extraction
+        :param month: Integer month of extraction
+        :param source_alias: A string-based description of the media source; defaults to `None` (i.e. all sources)
+        '''
+        import pandas as pd
+        stmt = (select(Source.alias, Term.term, Term.frequency)
+                    .join(Control, Control.control_id == Term.control_id)
+                    .join(Source, Source.source_id == Term.source_id)
+                    .where(Control.year == year, Control.month == month))
+        if source_alias is not None:
+            stmt = stmt.where(Source.alias == source_alias)
+        with self._reading() as read_session:
+            records = read_session.execute(stmt).all()
+        return pd.DataFrame(records, columns=['source', 'term', 'frequency'])
+
+    def insert_increment(self, batch_data: dict[pd.DataFrame], watermarks: dict[datetime], commentary: str = 'Incremental') -> list[int]:
+        '''
+        Merges an incremental extract of terms (i.e. those published since each source's 'high-water mark') into the
+        corresponding monthly `control` records. Terms are upserted and the watermarks advanced within a single transaction,
+        so a failed run can be safely repeated without double counting.
+
+        Months which have already been loaded successfully in full (see `insert_batch()`), or are being loaded in full, are left
+        untouched. Otherwise the month is left with status 'Incremental' (i.e. partial counts) until it is finalised by a full
+        batch load, which replaces the incremental counts of each source it loads.
+
+        :param batch_data: Dictionary of `pd.DataFrame` objects (keyed by source alias) with fields: `term`, `year`, `month` and `frequency`
+        :param watermarks: Dictionary of timestamps (keyed by source alias) identifying the latest headline in each extract
+        :param commentary: String description for the pipeline being administered (defaults to 'Incremental')
+        '''
+        control_ids = []
+        try:
+            # NB: registering a control (or its `term` partition) commits, so every period is registered up front; the terms
+            # and watermarks below are then written in a single transaction
+            periods = sorted({(int(year), int(month)) for source_terms_df in batch_data.values()
+                              for year, month in source_terms_df[['year', 'month']].drop_duplicates().itertuples(index=False)})
+            controls = {period: self._insert_control(*period, commentary) for period in periods}
+            for source_alias, source_terms_df in batch_data.items():
+                source_id = self._insert_source(source_alias)
+                for (year, month), period_terms_df in source_terms_df.groupby(['year', 'month']):
+                    control_id, _ = controls[int(year), int(month)]
+                    if not self._mark_incremental(control_id, commentary):
+                        continue
+                    self._upsert_terms(terms_df=period_terms_df,
+                                       source_id=source_id,
+                                       control_id=control_id)
+                    # NB: the batch progress (if any) no longer describes these rows, so the next batch replaces rather than resumes them
+                    self.db_session.execute(delete(Progress).where(Progress.source_id == source_id, Progress.control_id == control_id))
+                    control_ids.append(control_id)
+                if watermarks.get(source_alias) is not None:
+                    self._update_watermark(source_id, watermarks[source_alias])
+            self.db_session.commit()
+        except Exception as err:
+            logging.error(err)
+            self.db_session.rollback()
+            raise err
+        control_ids = sorted(set(control_ids))
+        if control_ids and self.term_matrix is not None:
+            self._refresh_term_matrix(control_ids)
+        return control_ids
+
+    def _refresh_term_matrix(self, control_ids: list[int]) -> None:
+        '''
+        Re-record the months identified by `control_ids` in the term matrix from the (primary) `term` table, i.e. once their
+        counts have been merged rather than loaded in full
+
+        :param control_ids: List of integers identifying control records
+        '''
+        import pandas as pd
+        stmt = (select(Control.year, Control.month, Source.alias, Term.term, Term.frequency)
+                    .join(Control, Control.control_id == Term.control_id)
+                    .join(Source, Source.source_id == Term.source_id)
+                    .where(Term.control_id.in_(control_ids)))
+        terms_df = pd.DataFrame(self.db_session.execute(stmt).all(), columns=['year', 'month', 'source', 'term', 'frequency'])
+        for (year, month), period_df in terms_df.groupby(['year', 'month']):
+            self.term_matrix.update(int(year), int(month), {source_alias: source_df for source_alias, source_df in period_df.groupby('source')})
     
 if __name__ == '__main__':
     pass
\ No newline at end of file
@@ -0,0 +1,205 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+
+from datetime import datetime
+from typing import TYPE_CHECKING
+from sqlalchemy import delete, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from .db import BatchConfig, DatabaseConfig, _build_db_url, _claim_statement, _claimable, _create_schema, _prepare_terms, _renew_statement, _term_partition_bounds, _term_partition_statements
+from .models import Control, Term, Source, Progress
+
+if TYPE_CHECKING:
+    import pandas as pd
+    from .matrix import TermMatrix
+
+class AsyncDatabaseManager():
+    '''
+    Asynchronous counterpart to `DatabaseManager()` for loading several months and/or sources concurrently. Writers share a
+    single connection pool and each (source, control) partition is written by its own session.
+
+    A month is only loaded by the writer which 'claims' its `control` record: the record is locked (`SELECT ... FOR UPDATE`)
+    and moved to status 'Loading' in a single transaction, so two writers can never claim the same month (see
+    `DatabaseManager._claim_control()`, which follows the same protocol). A claim lapses if it is not renewed within
+    `CLAIM_LEASE`, e.g. because its writer crashed, after which the month may be claimed again.
+
+    Usage:
+
+        async with AsyncDatabaseManager(DatabaseConfig(db_dialect='postgresql', db_api='asyncpg', ...)) as db:
+            await db.insert_batches([(batch_config, batch_data), ...])
+
+    :param database_config: Object of class `DatabaseConfig` (requires an asynchronous driver, e.g. 'asyncpg' or 'aiosqlite')
+    :param n_writers: Maximum number of partitions written concurrently (also the size of the connection pool)
+    :param term_matrix: Object of class `TermMatrix` which is updated whenever a batch completes; defaults to `None` (i.e. no materialisation)
+    '''
+    def __init__(self, database_config: DatabaseConfig, n_writers: int = 4, term_matrix: TermMatrix | None = None):
+        self.n_writers = n_writers
+        self.term_matrix = term_matrix
+        self.term_partition_size = database_config.term_partition_size
+        self._term_partitions = set()
+        engine_config = {'url': _build_db_url(database_config, asynchronous=True), 'echo': database_config.echo}
+        if database_config.db_dialect.lower() != 'sqlite':
+            engine_config.update(pool_size=n_writers, max_overflow=0)
+        self.engine = create_async_engine(**engine_config)
+        self.sessionmaker = async_sessionmaker(self.engine, expire_on_commit=False)
+        self._insert = postgresql.insert if self.engine.dialect.name == 'postgresql' else sqlite.insert
+
+    async def __aenter__(self) -> 'AsyncDatabaseManager':
+        await self.init_schema()
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        await self.engine.dispose()
+
+    async def init_schema(self) -> None:
+        '''
+        Initialise the schema for this database if it has not been created in the target database already
+        '''
+        async with self.engine.begin() as connection:
+            partitioned = await connection.run_sync(_create_schema, self.term_partition_size)
+        if not partitioned:
+            self.term_partition_size = None
+
+    async def _claim_control(self, session: AsyncSession, year: int, month: int, commentary: str) -> int | None:
+        '''
+        Claim the `control` record for a given period (registering it if need be); returns `None` if the period has already
+        been loaded or is claimed by another writer
+
+        :param session: Object of class `AsyncSession`
+        :param year: Integer year of extraction
+        :param month: Integer month of extraction
+        :param commentary: String description for the pipeline being administered
+        '''
+        await session.execute(self._insert(Control)
+                                  .values(year=year, month=month, commentary=commentary, status='In Progress', timestamp=datetime.now())
+                                  .on_conflict_do_nothing(index_elements=[Control.year, Control.month]))
+        stmt = select(Control.control_id, Control.status, Control.timestamp).where(Control.year == year, Control.month == month).with_for_update()
+        control_id, control_status, timestamp = (await session.execute(stmt)).one()
+        if not _claimable(control_status, timestamp) or (await session.execute(_claim_statement(control_id, control_status, timestamp))).rowcount != 1:
+            await session.rollback()
+            return None
+        # NB: the `term` partition for this month (if any) is created as part of the claim, before any writer needs it
+        partition = _term_partition_bounds(control_id, self.term_partition_size)[0] if self.term_partition_size else None
+        if partition is not None and partition not in self._term_partitions:
+            for stmt in _term_partition_statements(control_id, self.term_partition_size):
+                await session.execute(stmt)
+        await session.commit()
+        if partition is not None:
+            self._term_partitions.add(partition)
+        return control_id
+
+    async def _insert_source(self, session: AsyncSession, alias: str) -> int:
+        '''
+        Insert `source` record into the database; if source with `alias` already exists (e.g. registered by a concurrent writer), the corresponding ID is returned instead
+
+        :param session: Object of class `AsyncSession`
+        :param alias: A string-based description of the media source
+        '''
+        await session.execute(self._insert(Source).values(alias=alias).on_conflict_do_nothing(index_elements=[Source.alias]))
+        source_id = (await session.execute(select(Source.source_id).where(Source.alias == alias))).scalar_one()
+        await session.commit()
+        return source_id
+
+    async def _insert_terms(self, semaphore: asyncio.Semaphore, source_alias: str, terms_df: pd.DataFrame, control_id: int, chunk_size: int) -> None:
+        '''
+        Write a single (source, control) partition in chunks of `chunk_size` terms, resuming from the source's recorded progress if the extract is unchanged (see `DatabaseManager._insert_terms()`)
+
+        :param semaphore: Object of class `asyncio.Semaphore` bounding the number of concurrent writers
+        :param source_alias: A string-based description of the media source
+        :param terms_df: Object of class `pd.DataFrame` with fields: `term` and `frequency`
+        :param control_id: Integer identifying the (claimed) control record
+        :param chunk_size: Number of terms committed per transaction
+        '''
+        terms_dict, digest = _prepare_terms(terms_df)
+        async with semaphore, self.sessionmaker() as session:
+            source_id = await self._insert_source(session, source_alias)
+            stmt = select(Progress.n_terms, Progress.digest).where(Progress.source_id == source_id, Progress.control_id == control_id)
+            progress = (await session.execute(stmt)).first()
+            if progress is not None and progress.digest == digest:
+                n_terms = progress.n_terms
+            else:
+                # NB: a different extract replaces the terms recorded for this source and control (see `DatabaseManager._get_progress()`)
+                await session.execute(delete(Term).where(Term.source_id == source_id, Term.control_id == control_id))
+                insert = self._insert(Progress).values(source_id=source_id, control_id=control_id, n_terms=0, digest=digest)
+                await session.execute(insert.on_conflict_do_update(index_elements=[Progress.control_id, Progress.source_id],
+                                                                   set_={'n_terms': 0, 'digest': digest}))
+                await session.commit()
+                n_terms = 0
+            insert = self._insert(Term).on_conflict_do_nothing(index_elements=[Term.term, Term.source_id, Term.control_id])
+            for offset in range(n_terms, len(terms_dict), chunk_size):
+                chunk = terms_dict[offset:offset + chunk_size]
+                await session.execute(insert, [{'term': record['term'],
+                                                'frequency': int(record['frequency']),
+                                                'source_id': source_id,
+                                                'control_id': control_id} for record in chunk])
+                await session.execute(update(Progress)
+                                          .where(Progress.source_id == source_id, Progress.control_id == control_id)
+                                          .values(n_terms=offset + len(chunk)))
+                await session.execute(_renew_statement(control_id))
+                await session.commit()
+            await session.commit()
+
+    async def insert_batch(self, batch_config: BatchConfig, batch_data: dict[pd.DataFrame], semaphore: asyncio.Semaphore | None = None) -> int | None:
+        '''
+        Claims the period described by `batch_config` and writes each source in `batch_data` concurrently. Returns the
+        control identifier, or `None` if the period could not be claimed.
+
+        :param batch_config: Object of class `BatchConfig`
+        :param batch_data: Dictionary of `pd.DataFrame` objects (keyed by source alias) with fields: `term` and `frequency`
+        :param semaphore: Object of class `asyncio.Semaphore` shared between batches; defaults to `None` (i.e. bounded by `n_writers`)
+        '''
+        semaphore = semaphore or asyncio.Semaphore(self.n_writers)
+        async with self.sessionmaker() as session:
+            control_id = await self._claim_control(session, batch_config.year, batch_config.month, batch_config.commentary)
+        if control_id is None:
+            logging.warning(f'Batch {batch_config} has already been loaded or is being loaded elsewhere; skipping')
+            return None
+        # NB: the claim is always released, so a batch which is cancelled (or whose writers are) is marked 'Fatal' rather
+        # than left 'Loading' until its lease lapses
+        status, commentary = 'Fatal', 'Interrupted'
+        try:
+            results = await asyncio.gather(*(self._insert_terms(semaphore, source_alias, source_terms_df, control_id, batch_config.chunk_size)
+                                             for source_alias, source_terms_df in batch_data.items()),
+                                           return_exceptions=True)
+            failures = []
+            for source_alias, result in zip(batch_data, results):
+                if isinstance(result, BaseException):
+                    logging.error(f'Failed to load terms for source "{source_alias}": {result!r}')
+                    failures.append(f'{source_alias}: {result!r}')
+            status, commentary = ('Fatal', '; '.join(failures)) if failures else ('Success', batch_config.commentary)
+        finally:
+            await asyncio.shield(self._update_control(control_id, status, commentary))
+        if status == 'Success' and self.term_matrix is not None:
+            # NB: the update does not yield to the event loop, so concurrent batches cannot interleave their writes to the matrix
+            self.term_matrix.update(batch_config.year, batch_config.month, batch_data)
+        return control_id
+
+    async def _update_control(self, control_id: int, status: str, commentary: str) -> None:
+        async with self.sessionmaker() as session:
+            await session.execute(update(Control)
+                                      .where(Control.control_id == control_id)
+                                      .values(timestamp=datetime.now(), status=status, commentary=commentary[:100]))
+            await session.commit()
+
+    async def insert_batches(self, batches: list[tuple[BatchConfig, dict[pd.DataFrame]]]) -> list[int | None]:
+        '''
+        Inserts several batches concurrently, writing at most `n_writers` (source, control) partitions at any one time. A
+        batch which fails does not interrupt the others; its control identifier is returned as `None`.
+
+        :param batches: List of `(batch_config, batch_data)` pairs (see `insert_batch()`)
+        '''
+        semaphore = asyncio.Semaphore(self.n_writers)
+        results = await asyncio.gather(*(self.insert_batch(batch_config, batch_data, semaphore) for batch_config, batch_data in batches),
+                                       return_exceptions=True)
+        control_ids = []
+        for (batch_config, _), result in zip(batches, results):
+            if isinstance(result, BaseException):
+                logging.error(f'Failed to load batch {batch_config}: {result!r}')
+                result = None
+            control_ids.append(result)
+        return control_ids
+
+if __name__ == '__main__':
+    pass
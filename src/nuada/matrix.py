@@ -0,0 +1,174 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from .models import Control, Term, Source
+
+class TermMatrix():
+    '''
+    Materialised (term x month x source) frequency matrix, stored as a memory-mapped NumPy array (`counts.npy`) alongside
+    an index of its vocabulary, periods and sources (`index.json`). Whole-vocabulary comparisons between sources are then
+    answered with vectorised operations rather than by pivoting the `term` table at query time.
+
+    NB: the array is laid out as (source x month x term) so that recording a month for a source writes a contiguous
+    block. It is allocated with spare capacity along each axis, which is doubled (i.e. the file is rewritten) whenever a
+    new term, period or source no longer fits.
+
+    :param directory: Directory in which the matrix is stored; created if it does not already exist
+    '''
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        if os.path.exists(self._index_path):
+            with open(self._index_path, 'r') as f:
+                index = json.load(f)
+            self.counts = np.load(self._counts_path, mmap_mode='r+')
+        else:
+            index = {'vocabulary': [], 'periods': [], 'sources': []}
+            self.counts = np.lib.format.open_memmap(self._counts_path, mode='w+', dtype=np.int32, shape=(2, 12, 1024))
+        self.vocabulary = pd.Index(index['vocabulary'], dtype=object)
+        self.periods = pd.Index(index['periods'], dtype=np.int64)
+        self.sources = pd.Index(index['sources'], dtype=object)
+
+    def __repr__(self) -> str:
+        return f'(Term matrix: {self.directory}, Shape: {self.shape})'
+
+    @property
+    def _counts_path(self) -> str:
+        return os.path.join(self.directory, 'counts.npy')
+
+    @property
+    def _index_path(self) -> str:
+        return os.path.join(self.directory, 'index.json')
+
+    @property
+    def shape(self) -> tuple[int, int, int]:
+        return len(self.vocabulary), len(self.periods), len(self.sources)
+
+    def _slice(self, source_alias: str) -> np.ndarray:
+        '''
+        View of the (month x term) frequencies recorded for a given source
+        '''
+        n_terms, n_periods, _ = self.shape
+        return self.counts[self.sources.get_loc(source_alias), :n_periods, :n_terms]
+
+    def _reserve(self, shape: tuple[int, int, int]) -> None:
+        '''
+        Ensure the underlying array can hold at least `shape` (i.e. source x month x term) entries, doubling its capacity along each axis as required
+        '''
+        capacity = tuple(max(current, 1) for current in self.counts.shape)
+        if all(required <= current for required, current in zip(shape, capacity)):
+            return
+        capacity = tuple(current * 2 ** int(np.ceil(np.log2(max(required / current, 1)))) for required, current in zip(shape, capacity))
+        resized_path = self._counts_path + '.resize'
+        resized = np.lib.format.open_memmap(resized_path, mode='w+', dtype=np.int32, shape=capacity)
+        resized[tuple(slice(0, current) for current in self.counts.shape)] = self.counts
+        resized.flush()
+        del self.counts, resized
+        os.replace(resized_path, self._counts_path)
+        self.counts = np.load(self._counts_path, mmap_mode='r+')
+
+    def _persist(self) -> None:
+        self.counts.flush()
+        index = {'vocabulary': self.vocabulary.tolist(), 'periods': self.periods.tolist(), 'sources': self.sources.tolist()}
+        with open(self._index_path + '.tmp', 'w') as f:
+            json.dump(index, f)
+        os.replace(self._index_path + '.tmp', self._index_path)
+
+    def update(self, year: int, month: int, batch_data: dict[pd.DataFrame]) -> None:
+        '''
+        Record the term frequencies of a completed month; any values previously recorded for that month and source are replaced
+
+        :param year: Integer year of extraction
+        :param month: Integer month of extraction
+        :param batch_data: Dictionary of `pd.DataFrame` objects (keyed by source alias) with fields: `term` and `frequency`
+        '''
+        self._record(year, month, batch_data)
+        self._persist()
+
+    def _record(self, year: int, month: int, batch_data: dict[pd.DataFrame]) -> None:
+        period = year * 100 + month
+        if period not in self.periods:
+            self.periods = self.periods.append(pd.Index([period], dtype=np.int64))
+        new_sources = pd.Index(list(batch_data), dtype=object).difference(self.sources, sort=False)
+        self.sources = self.sources.append(new_sources)
+        new_terms = pd.Index(pd.concat([terms_df['term'] for terms_df in batch_data.values()]).unique(), dtype=object).difference(self.vocabulary, sort=False)
+        self.vocabulary = self.vocabulary.append(new_terms)
+        n_terms, n_periods, n_sources = self.shape
+        self._reserve((n_sources, n_periods, n_terms))
+
+        p = self.periods.get_loc(period)
+        for source_alias, terms_df in batch_data.items():
+            s = self.sources.get_loc(source_alias)
+            self.counts[s, p, :] = 0
+            self.counts[s, p, self.vocabulary.get_indexer(terms_df['term'])] = terms_df['frequency'].to_numpy()
+
+    @classmethod
+    def build(cls, directory: str, db_session: Session) -> 'TermMatrix':
+        '''
+        Build the matrix from scratch from the `term` table of the database bound to `db_session` (i.e. every month loaded in full or incrementally)
+
+        :param directory: Directory in which the matrix is stored
+        :param db_session: Object of class `Session` (e.g. `DatabaseManager.read_session`, so that a rebuild is served by the read replica where one is configured)
+        '''
+        stmt = (select(Control.year, Control.month, Source.alias, Term.term, Term.frequency)
+                    .join(Control, Control.control_id == Term.control_id)
+                    .join(Source, Source.source_id == Term.source_id)
+                    .where(Control.status.in_(('Success', 'Incremental'))))
+        terms_df = pd.DataFrame(db_session.execute(stmt).all(), columns=['year', 'month', 'source', 'term', 'frequency'])
+        term_matrix = cls(directory)
+        for (year, month), period_df in terms_df.groupby(['year', 'month']):
+            term_matrix._record(int(year), int(month), {source_alias: source_df for source_alias, source_df in period_df.groupby('source')})
+        term_matrix._persist()
+        return term_matrix
+
+    def frequencies(self, source_alias: str) -> pd.DataFrame:
+        '''
+        Term-frequency time series for a given source (i.e. one row per term and one column per period, in period order)
+
+        :param source_alias: A string-based description of the media source
+        '''
+        order = np.argsort(self.periods.to_numpy())
+        return pd.DataFrame(self._slice(source_alias)[order].T, index=self.vocabulary, columns=self.periods[order])
+
+    def source_correlation(self, source_a: str, source_b: str) -> pd.Series:
+        '''
+        Pearson correlation between the monthly frequencies of each term in `source_a` and `source_b` (`NaN` for terms
+        which are constant in either source)
+
+        :param source_a: Alias of the first media source
+        :param source_b: Alias of the second media source
+        '''
+        a = self._slice(source_a).astype(np.float32)
+        b = self._slice(source_b).astype(np.float32)
+        a -= a.mean(axis=0)
+        b -= b.mean(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            correlation = np.einsum('pt,pt->t', a, b) / np.sqrt(np.einsum('pt,pt->t', a, a) * np.einsum('pt,pt->t', b, b))
+        return pd.Series(correlation, index=self.vocabulary, name='correlation')
+
+    def divergence(self, source_a: str, source_b: str, n_top: int = 10) -> pd.DataFrame:
+        '''
+        Terms whose share of each source's coverage (i.e. frequency as a proportion of all terms counted) diverges the most;
+        the shares are reported in columns named after each source and `divergence` is their difference
+
+        :param source_a: Alias of the first media source
+        :param source_b: Alias of the second media source
+        :param n_top: Number of terms to return
+        '''
+        totals_a = self._slice(source_a).sum(axis=0, dtype=np.int64)
+        totals_b = self._slice(source_b).sum(axis=0, dtype=np.int64)
+        share_a = totals_a / max(totals_a.sum(), 1)
+        share_b = totals_b / max(totals_b.sum(), 1)
+        divergence = share_a - share_b
+        top = np.argsort(-np.abs(divergence), kind='stable')[:n_top]
+        return pd.DataFrame({'term': self.vocabulary[top],
+                             source_a: share_a[top],
+                             source_b: share_b[top],
+                             'divergence': divergence[top]})
+
+if __name__ == '__main__':
+    pass
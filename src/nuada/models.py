@@ -1,4 +1,4 @@
-from sqlalchemy import String, Integer, DateTime, UniqueConstraint, ForeignKey, Text
+from sqlalchemy import String, Integer, DateTime, UniqueConstraint, ForeignKey, Text, LargeBinary
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 from datetime import datetime
 from typing import Optional
@@ -64,5 +64,45 @@ class Source(Base):
     def __repr__(self) -> str:
         return f'(source_id: {self.source_id}, alias: {self.alias})'
 
+class Progress(Base):
+    '''
+    Used to capture the progress of a batch run for each `Source` (i.e. how many of its terms have been committed against the
+    `Control` record, and a digest of the extract they were taken from)
+    '''
+    __tablename__ = 'progress'
+
+    control_id: Mapped[int] = mapped_column(ForeignKey('control.control_id'), primary_key=True)
+    source_id: Mapped[int] = mapped_column(ForeignKey('source.source_id'), primary_key=True)
+    n_terms: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    digest: Mapped[Optional[str]] = mapped_column(String(64))
+
+    def __repr__(self) -> str:
+        return f'(control_id: {self.control_id}, source_id: {self.source_id}, n_terms: {self.n_terms}, digest: {self.digest})'
+
+class Watermark(Base):
+    '''
+    Represents the 'high-water mark' for incremental ingestion (i.e. the latest publication timestamp loaded for a given `Source`)
+    '''
+    __tablename__ = 'watermark'
+
+    source_id: Mapped[int] = mapped_column(ForeignKey('source.source_id'), primary_key=True)
+    published: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+
+    def __repr__(self) -> str:
+        return f'(source_id: {self.source_id}, published: {self.published})'
+
+class Sketch(Base):
+    '''
+    Represents the approximate term counts (i.e. a serialised `TermSketch`) sourced from the relevant outlet in `Source`
+    '''
+    __tablename__ = 'sketch'
+
+    source_id: Mapped[int] = mapped_column(ForeignKey('source.source_id'), primary_key=True)
+    control_id: Mapped[int] = mapped_column(ForeignKey('control.control_id'), primary_key=True)
+    payload: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+
+    def __repr__(self) -> str:
+        return f'(source_id: {self.source_id}, control_id: {self.control_id}, payload: {len(self.payload)} bytes)'
+
 if __name__ == '__main__':
     pass
\ No newline at end of file
@@ -0,0 +1,175 @@
+import dataclasses
+import hashlib
+import importlib.metadata
+import json
+import os
+import sqlite3
+import struct
+import time
+import zlib
+import numpy as np
+import pandas as pd
+
+from typing import Callable
+
+_CACHE_VERSION = 1 # NB: increment whenever the transformation logic changes so that stale results are never served
+_HASH_KEY = 'nuada-headline-h' # NB: fixed 16-character key so that digests are stable across processes
+_MAX_VARIABLES = 900 # NB: SQLite limits the number of bound parameters per statement
+
+_TOKEN_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS token (
+    digest INTEGER PRIMARY KEY,
+    tokens TEXT NOT NULL,
+    last_used INTEGER NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS token_last_used ON token (last_used);
+
+CREATE TABLE IF NOT EXISTS token_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+'''
+
+def _tokenizer_identity(tokenizer: Callable[[str], list[str]]) -> str:
+    '''
+    Identify the tokenizer (and the version of the package providing it) alongside `_CACHE_VERSION`, so that cached tokens
+    are discarded whenever any of these change
+    '''
+    module = getattr(tokenizer, '__module__', None) or ''
+    try:
+        version = importlib.metadata.version(module.split('.')[0])
+    except (importlib.metadata.PackageNotFoundError, ValueError):
+        version = ''
+    return f'{_CACHE_VERSION}:{module}.{getattr(tokenizer, "__qualname__", type(tokenizer).__qualname__)}:{version}'
+
+def _encode_terms(terms_df: pd.DataFrame) -> bytes:
+    '''
+    Encode an aggregated term table (i.e. fields `term`, `year`, `month` and `frequency`) into a compressed binary payload
+    '''
+    terms = '\n'.join(terms_df['term']).encode('utf-8')
+    values = np.stack([terms_df['year'], terms_df['month'], terms_df['frequency']]).astype('<i4')
+    return zlib.compress(struct.pack('<II', len(terms_df), len(terms)) + terms + values.tobytes())
+
+def _decode_terms(payload: bytes) -> pd.DataFrame:
+    '''
+    Decode an aggregated term table from a binary payload (see `_encode_terms()`)
+    '''
+    payload = zlib.decompress(payload)
+    n_rows, n_bytes = struct.unpack_from('<II', payload)
+    offset = struct.calcsize('<II')
+    terms = payload[offset:offset + n_bytes].decode('utf-8').split('\n') if n_rows else []
+    year, month, frequency = np.frombuffer(payload[offset + n_bytes:], dtype='<i4').reshape(3, n_rows).astype(np.int64)
+    return pd.DataFrame({'term': terms, 'year': year, 'month': month, 'frequency': frequency})
+
+class TransformCache():
+    '''
+    On-disk memoisation of `transform()`. Aggregated term tables are keyed by a content hash of the headlines plus the
+    transformer configuration and evicted (least recently used first) once their total size exceeds `max_bytes`. The tokens
+    of each headline are also cached (keyed by a hash of the headline), so that a month which differs by only a few
+    headlines only re-tokenizes those; these are discarded whenever the tokenizer, its version or `_CACHE_VERSION` changes.
+
+    :param directory: Directory in which the cache is stored; created if it does not already exist
+    :param max_bytes: Size budget for cached term tables
+    :param max_tokens: Maximum number of headlines whose tokens are cached
+    '''
+    def __init__(self, directory: str, max_bytes: int = 256 * 1024 ** 2, max_tokens: int = 1_000_000):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_tokens = max_tokens
+        os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(os.path.join(directory, 'tokens.db'))
+        self.connection.executescript(_TOKEN_SCHEMA)
+
+    def __repr__(self) -> str:
+        return f'(Transform cache: {self.directory}, Budget: {self.max_bytes:,} bytes)'
+
+    def key(self, headlines_df: pd.DataFrame, config: object, dependencies: tuple[str, ...] = ()) -> str:
+        '''
+        Content hash of the headlines (and their periods) in `headlines_df`, the transformer configuration `config` and
+        anything else the result depends on (e.g. the tokenizer and the resolved stop words)
+
+        :param headlines_df: `pd.DataFrame` object with *at least* columns `headline`, `year` and `month`
+        :param config: Dataclass instance describing the transformer configuration (e.g. `TransformConfig`)
+        :param dependencies: Identities of external inputs to the transformation (e.g. see `_tokenizer_identity()`)
+        '''
+        digests = pd.util.hash_pandas_object(headlines_df[['headline', 'year', 'month']], index=False, hash_key=_HASH_KEY)
+        configuration = json.dumps([dataclasses.asdict(config), list(dependencies)], sort_keys=True, default=str)
+        content = digests.to_numpy().tobytes() + f'{_CACHE_VERSION}:{configuration}'.encode('utf-8')
+        return hashlib.sha256(content).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f'{key}.terms')
+
+    def get(self, key: str) -> pd.DataFrame | None:
+        '''
+        Retrieve the term table cached against `key` (marking it as recently used), if any
+
+        :param key: Cache key (see `TransformCache.key()`)
+        '''
+        try:
+            with open(self._path(key), 'rb') as f:
+                payload = f.read()
+        except FileNotFoundError:
+            return None
+        os.utime(self._path(key))
+        return _decode_terms(payload)
+
+    def put(self, key: str, terms_df: pd.DataFrame) -> None:
+        '''
+        Cache the term table `terms_df` against `key`, evicting the least recently used tables if the budget is exceeded
+
+        :param key: Cache key (see `TransformCache.key()`)
+        :param terms_df: `pd.DataFrame` object with fields `term`, `year`, `month` and `frequency`
+        '''
+        with open(self._path(key) + '.tmp', 'wb') as f:
+            f.write(_encode_terms(terms_df))
+        os.replace(self._path(key) + '.tmp', self._path(key))
+        self._evict()
+
+    def _evict(self) -> None:
+        entries = [entry for entry in os.scandir(self.directory) if entry.name.endswith('.terms')]
+        entries.sort(key=lambda entry: entry.stat().st_mtime_ns)
+        total = sum(entry.stat().st_size for entry in entries)
+        for entry in entries:
+            if total <= self.max_bytes:
+                break
+            total -= entry.stat().st_size
+            os.remove(entry.path)
+
+    def tokenize(self, headlines: pd.Series, tokenizer: Callable[[str], list[str]]) -> pd.Series:
+        '''
+        Tokenize each headline in `headlines`, only applying `tokenizer` to headlines whose tokens are not already cached
+
+        :param headlines: `pd.Series` object of headlines
+        :param tokenizer: Function mapping a headline to its list of tokens (e.g. `nltk.tokenize.word_tokenize`)
+        '''
+        digests = pd.util.hash_array(headlines.to_numpy(dtype=object), hash_key=_HASH_KEY).view(np.int64)
+        unique_digests = list(dict.fromkeys(digests.tolist()))
+        tokens, now, identity = {}, time.time_ns(), _tokenizer_identity(tokenizer)
+        with self.connection:
+            cached_identity = self.connection.execute("SELECT value FROM token_meta WHERE key = 'tokenizer'").fetchone()
+            if cached_identity is None or cached_identity[0] != identity:
+                # NB: tokens cached by another tokenizer (or version thereof) are stale, so the cache starts afresh
+                self.connection.execute('DELETE FROM token')
+                self.connection.execute("INSERT OR REPLACE INTO token_meta (key, value) VALUES ('tokenizer', ?)", (identity,))
+            for n in range(0, len(unique_digests), _MAX_VARIABLES):
+                chunk = unique_digests[n:n + _MAX_VARIABLES]
+                placeholders = ', '.join('?' * len(chunk))
+                rows = self.connection.execute(f'SELECT digest, tokens FROM token WHERE digest IN ({placeholders})', chunk).fetchall()
+                tokens.update((digest, json.loads(cached)) for digest, cached in rows)
+                self.connection.execute(f'UPDATE token SET last_used = ? WHERE digest IN ({placeholders})', [now, *chunk])
+            misses = {digest: headline for digest, headline in zip(digests.tolist(), headlines) if digest not in tokens}
+            for digest, headline in misses.items():
+                tokens[digest] = tokenizer(headline)
+            self.connection.executemany('INSERT OR REPLACE INTO token (digest, tokens, last_used) VALUES (?, ?, ?)',
+                                        [(digest, json.dumps(tokens[digest]), now) for digest in misses])
+            self.connection.execute('''DELETE FROM token WHERE digest IN (
+                                           SELECT digest FROM token ORDER BY last_used DESC LIMIT -1 OFFSET ?)''', (self.max_tokens,))
+        return pd.Series([tokens[digest] for digest in digests.tolist()], index=headlines.index, dtype=object)
+
+    def close(self) -> None:
+        self.connection.close()
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,135 @@
+import itertools
+import logging
+import numpy as np
+import pandas as pd
+
+from dataclasses import dataclass
+
+_HASH_KEY = 'nuada-shingle-h0' # NB: fixed 16-character key so that signatures are stable across processes
+
+@dataclass
+class DedupConfig:
+    '''
+    Configure the removal of duplicate headlines prior to tokenization (see `deduplicate_headlines()` for more detail).
+
+    :param near: Whether to remove near-duplicates (via MinHash/LSH) in addition to exact duplicates
+    :param threshold: Estimated Jaccard similarity (of character shingles) at or above which two headlines are near-duplicates
+    :param n_permutations: Length of each MinHash signature
+    :param n_bands: Number of LSH bands; must divide `n_permutations` (more bands find more candidates at lower similarities)
+    :param shingle_size: Number of characters per shingle
+    :param seed: Seed for the MinHash permutations
+    '''
+    near: bool = False
+    threshold: float = 0.8
+    n_permutations: int = 64
+    n_bands: int = 16
+    shingle_size: int = 4
+    seed: int = 1694
+
+    def __repr__(self) -> str:
+        return f'(Near: {self.near}, Threshold: {self.threshold}, Permutations: {self.n_permutations}, Bands: {self.n_bands})'
+
+def _normalise_headlines(headlines: pd.Series) -> pd.Series:
+    '''
+    Standardise headlines for comparison: lower case, punctuation removed and whitespace collapsed
+    '''
+    return (headlines.astype(str)
+                .str.lower()
+                .str.replace(r'[^\w\s]', ' ', regex=True)
+                .str.split()
+                .str.join(' '))
+
+def _minhash_signatures(normalised: pd.Series, config: DedupConfig) -> np.ndarray:
+    '''
+    Compute a MinHash signature (one row of `n_permutations` 32-bit values) per headline from its character shingles.
+    Permutations are simulated with multiply-shift hashing of a single 64-bit hash per shingle.
+    '''
+    k = config.shingle_size
+    shingles = normalised.map(lambda headline: [headline[i:i + k] for i in range(max(len(headline) - k + 1, 1))])
+    lengths = shingles.str.len().to_numpy()
+    hashes = pd.util.hash_array(np.asarray(list(itertools.chain.from_iterable(shingles)), dtype=object), hash_key=_HASH_KEY)
+    offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    rng = np.random.default_rng(config.seed)
+    multipliers = rng.integers(1, 2 ** 63, size=config.n_permutations, dtype=np.uint64) | np.uint64(1)
+    increments = rng.integers(0, 2 ** 63, size=config.n_permutations, dtype=np.uint64)
+    signatures = np.empty((len(normalised), config.n_permutations), dtype=np.uint32)
+    for n in range(config.n_permutations):
+        permuted = ((hashes * multipliers[n] + increments[n]) >> np.uint64(32)).astype(np.uint32)
+        signatures[:, n] = np.minimum.reduceat(permuted, offsets)
+    return signatures
+
+def _near_duplicate_mask(normalised: pd.Series, config: DedupConfig) -> np.ndarray:
+    '''
+    Flag every headline which is a near-duplicate of a preceding headline. Candidate pairs are those sharing an identical
+    band of their MinHash signatures (i.e. LSH); candidates are confirmed if their signatures agree on at least `threshold`
+    of their values. Clusters are resolved with a union-find so that the first headline of each cluster is retained.
+
+    NB: each headline is only compared with the first member of its bucket, so there are at most `n - 1` candidate pairs
+    per band and O(n * n_bands) comparisons in total, however many headlines share a bucket. Signatures and buckets are
+    vectorised, but the comparisons (and merges) run in a Python loop, so their constant factor dominates.
+    '''
+    if config.n_permutations % config.n_bands:
+        raise ValueError('Input variable `n_bands` must divide `n_permutations`')
+    if normalised.empty:
+        return np.zeros(0, dtype=bool)
+    signatures = _minhash_signatures(normalised, config)
+    rows = config.n_permutations // config.n_bands
+    parent = np.arange(len(normalised))
+
+    def find(n: int) -> int:
+        while parent[n] != n:
+            parent[n] = parent[parent[n]]
+            n = parent[n]
+        return n
+
+    for band in range(config.n_bands):
+        keys = pd.util.hash_pandas_object(pd.DataFrame(signatures[:, band * rows:(band + 1) * rows]), index=False).to_numpy()
+        order = np.argsort(keys, kind='stable')
+        sorted_keys = keys[order]
+        # NB: within each bucket of identical band keys, compare every member against the bucket's first member
+        starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+        bucket_first = order[np.repeat(starts, np.diff(np.r_[starts, len(keys)]))]
+        candidates = np.flatnonzero(bucket_first != order)
+        for first, member in zip(bucket_first[candidates], order[candidates]):
+            if (signatures[first] == signatures[member]).mean() >= config.threshold:
+                root_first, root_member = find(first), find(member)
+                parent[max(root_first, root_member)] = min(root_first, root_member)
+    roots = np.array([find(n) for n in range(len(normalised))], dtype=np.int64)
+    return roots != np.arange(len(normalised))
+
+def deduplicate_headlines(headlines_df: pd.DataFrame, config: DedupConfig = DedupConfig()) -> pd.DataFrame:
+    '''
+    Remove duplicate headlines (e.g. live-blog updates, corrections and republished pieces) so that they are only counted
+    once. Exact duplicates are identified by hashing normalised headlines and, optionally, near-duplicates via MinHash/LSH;
+    the first occurrence (in row order) of each headline is retained. Duplicates are only sought within the same `year` and `month`.
+
+    :param headlines_df: `pd.DataFrame` object with *at least* columns `headline`, `year` and `month`
+    :param config: Object of class `DedupConfig`
+    '''
+    normalised = _normalise_headlines(headlines_df['headline'])
+    periods = headlines_df['year'].astype(str) + '-' + headlines_df['month'].astype(str)
+    exact_mask = pd.DataFrame({'period': periods, 'headline': normalised}).duplicated().to_numpy()
+    near_mask = np.zeros(len(headlines_df), dtype=bool)
+    if config.near:
+        retained = np.flatnonzero(~exact_mask)
+        for _, positions in pd.Series(retained).groupby(periods.to_numpy()[retained]):
+            positions = positions.to_numpy()
+            near_mask[positions] = _near_duplicate_mask(normalised.iloc[positions].reset_index(drop=True), config)
+    logging.info(f'Removed {exact_mask.sum()} exact and {near_mask.sum()} near-duplicate headlines (of {len(headlines_df)})')
+    return headlines_df[~(exact_mask | near_mask)].reset_index(drop=True)
+
+def deduplicate_sources(headlines: dict[pd.DataFrame], config: DedupConfig = DedupConfig()) -> dict[pd.DataFrame]:
+    '''
+    Remove duplicate headlines *across* sources (e.g. syndicated pieces); a headline is retained by the first source (in
+    order of `headlines`) which published it
+
+    :param headlines: Dictionary of `pd.DataFrame` objects (keyed by source alias) with *at least* columns `headline`, `year` and `month`
+    :param config: Object of class `DedupConfig`
+    '''
+    combined_df = pd.concat(headlines, names=['source', None]).reset_index(level='source')
+    deduplicated_df = deduplicate_headlines(combined_df.reset_index(drop=True), config)
+    return {source_alias: deduplicated_df[deduplicated_df['source'] == source_alias].drop(columns='source').reset_index(drop=True)
+            for source_alias in headlines}
+
+if __name__ == '__main__':
+    pass
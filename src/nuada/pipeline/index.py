@@ -0,0 +1,150 @@
+import hashlib
+import sqlite3
+import pandas as pd
+
+_SCHEMA_VERSION = 2
+_MAX_VARIABLES = 900 # NB: SQLite limits the number of bound parameters per statement
+
+# NB: `headline_id` is derived from the publication time (see `HeadlineIndex.add()`), so that FTS5 serves matches most
+# recent first (i.e. `ORDER BY rowid DESC`) without sorting them
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS headline (
+    headline_id INTEGER PRIMARY KEY,
+    digest BLOB NOT NULL UNIQUE,
+    source TEXT NOT NULL,
+    source_token TEXT NOT NULL,
+    year INTEGER NOT NULL,
+    month INTEGER NOT NULL,
+    period TEXT NOT NULL,
+    publication_date TEXT NOT NULL,
+    headline TEXT NOT NULL
+);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS headline_fts USING fts5(
+    headline,
+    period,
+    source_token,
+    content='headline',
+    content_rowid='headline_id',
+    tokenize='unicode61',
+    detail='column'
+);
+'''
+
+def _quote(token: str) -> str:
+    '''
+    Quote `token` as an FTS5 string so that it is matched literally (i.e. not parsed as query syntax)
+    '''
+    return '"' + token.replace('"', '""') + '"'
+
+def _source_token(source_alias: str) -> str:
+    '''
+    Single (alphanumeric) token identifying a source, so that e.g. 'New York Times' is not matched by a query for 'York Times'
+    '''
+    return 's' + hashlib.sha1(source_alias.encode('utf-8')).hexdigest()[:16]
+
+class HeadlineIndex():
+    '''
+    Inverted index of archived headlines, mapping normalised (i.e. case-folded) terms to the headlines they appear in for
+    each source and period. Backed by SQLite FTS5, whose posting lists are delta and varint encoded on disk.
+
+    :param path: Path to the index file; defaults to ':memory:' (i.e. a transient index)
+    '''
+    def __init__(self, path: str = ':memory:'):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        version = self.connection.execute('PRAGMA user_version').fetchone()[0]
+        exists = self.connection.execute("SELECT 1 FROM sqlite_master WHERE name = 'headline'").fetchone() is not None
+        if exists and version < _SCHEMA_VERSION:
+            self._migrate()
+        self.connection.executescript(_SCHEMA + f'PRAGMA user_version = {_SCHEMA_VERSION};')
+
+    def __repr__(self) -> str:
+        return f'(Headline index: {self.path})'
+
+    def _migrate(self) -> None:
+        '''
+        Rebuild an index created with an earlier schema, re-indexing its headlines
+        '''
+        headlines_df = pd.read_sql('SELECT source, publication_date, headline, year, month FROM headline', self.connection)
+        with self.connection:
+            self.connection.executescript('DROP TABLE IF EXISTS headline_fts; DROP TABLE headline;')
+        self.connection.executescript(_SCHEMA + f'PRAGMA user_version = {_SCHEMA_VERSION};')
+        headlines_df['publication_date'] = pd.to_datetime(headlines_df['publication_date'], utc=True)
+        for source_alias, source_df in headlines_df.groupby('source'):
+            self.add(source_alias, source_df)
+
+    def add(self, source_alias: str, headlines_df: pd.DataFrame) -> int:
+        '''
+        Index the headlines in `headlines_df` for the source identified by `source_alias`; headlines which have already been
+        indexed are ignored, so re-running a month is safe. Returns the number of headlines newly indexed.
+
+        Each headline is identified by its publication time (in nanoseconds since the epoch), moved on to the next free
+        identifier if several headlines share a publication time.
+
+        :param source_alias: A string-based description of the media source
+        :param headlines_df: `pd.DataFrame` object with *at least* columns `publication_date`, `headline`, `year` and `month`
+        '''
+        timestamps = pd.to_datetime(headlines_df['publication_date'], utc=True).astype('datetime64[ns, UTC]').astype('int64')
+        source_token = _source_token(source_alias)
+        records = {}
+        for timestamp, (publication_date, headline, year, month) in zip(timestamps, headlines_df[['publication_date', 'headline', 'year', 'month']].itertuples(index=False)):
+            digest = hashlib.sha1(f'{source_alias}\x1f{publication_date}\x1f{headline}'.encode('utf-8')).digest()
+            # NB: the period is indexed as a pair of tokens (e.g. 'y2023 m202309') so that either a year or a month can be matched
+            period = f'y{year} m{year}{month:02d}'
+            records.setdefault(digest, (int(timestamp), digest, source_alias, source_token, int(year), int(month), period, str(publication_date), headline))
+        with self.connection:
+            digests = list(records)
+            for n in range(0, len(digests), _MAX_VARIABLES):
+                chunk = digests[n:n + _MAX_VARIABLES]
+                for (digest,) in self.connection.execute(f'SELECT digest FROM headline WHERE digest IN ({", ".join("?" * len(chunk))})', chunk):
+                    del records[digest]
+            if not records:
+                return 0
+            new_records = sorted(records.values(), key=lambda record: record[0])
+            taken = {headline_id for (headline_id,) in self.connection.execute('SELECT headline_id FROM headline WHERE headline_id BETWEEN ? AND ?',
+                                                                                 (new_records[0][0], new_records[-1][0] + len(new_records)))}
+            rows = []
+            for headline_id, *record in new_records:
+                while headline_id in taken:
+                    headline_id += 1
+                taken.add(headline_id)
+                rows.append((headline_id, *record))
+            self.connection.executemany('''INSERT INTO headline (headline_id, digest, source, source_token, year, month, period, publication_date, headline)
+                                           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''', rows)
+            self.connection.executemany('INSERT INTO headline_fts (rowid, headline, period, source_token) VALUES (?, ?, ?, ?)',
+                                        [(row[0], row[8], row[6], row[3]) for row in rows])
+        return len(rows)
+
+    def search(self, term: str, year: int | None = None, month: int | None = None, source_alias: str | None = None, limit: int = 100) -> pd.DataFrame:
+        '''
+        Look up the headlines containing `term`, optionally restricted to a given period and/or source
+
+        :param term: Term of interest (e.g. as recorded in the `term` table)
+        :param year: Year of interest; defaults to `None` (i.e. all years)
+        :param month: Month of interest (requires `year`); defaults to `None` (i.e. all months)
+        :param source_alias: A string-based description of the media source; defaults to `None` (i.e. all sources)
+        :param limit: Maximum number of headlines to return (most recently published first)
+        '''
+        if month is not None and year is None:
+            raise ValueError('Input variable `year` must be specified alongside `month`')
+        query = f'headline : {_quote(term)}'
+        if month is not None:
+            query += f' AND period : {_quote(f"m{year}{month:02d}")}'
+        elif year is not None:
+            query += f' AND period : {_quote(f"y{year}")}'
+        if source_alias is not None:
+            query += f' AND source_token : {_quote(_source_token(source_alias))}'
+        # NB: the limit is applied to the matches (in descending rowid, i.e. publication, order) before they are joined
+        stmt = '''SELECT h.headline_id, h.source, h.year, h.month, h.publication_date, h.headline
+                  FROM (SELECT rowid FROM headline_fts WHERE headline_fts MATCH ? ORDER BY rowid DESC LIMIT ?) AS matches
+                  JOIN headline h ON h.headline_id = matches.rowid
+                  ORDER BY h.headline_id DESC'''
+        rows = self.connection.execute(stmt, (query, limit)).fetchall()
+        return pd.DataFrame(rows, columns=['headline_id', 'source', 'year', 'month', 'publication_date', 'headline'])
+
+    def close(self) -> None:
+        self.connection.close()
+
+if __name__ == '__main__':
+    pass
@@ -3,28 +3,57 @@ import pandas as pd
 import time
 import logging
 import itertools
+import threading
 
-from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta, timezone
 from requests.exceptions import RequestException
 
+GUARDIAN_URL = 'https://content.guardianapis.com/search'
+GUARDIAN_MAX_PAGE_SIZE = 200
+
+@dataclass
+class RequestStats:
+    '''
+    Tally of the requests made (and bytes transferred) whilst extracting headlines; safe to share between threads
+
+    :param n_requests: Number of GET requests made
+    :param n_bytes: Number of (response body) bytes transferred
+    '''
+    n_requests: int = 0
+    n_bytes: int = 0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def record(self, n_bytes: int) -> None:
+        with self._lock:
+            self.n_requests += 1
+            self.n_bytes += n_bytes
+
+    def __repr__(self) -> str:
+        return f'(Requests: {self.n_requests}, Bytes: {self.n_bytes:,})'
+
 def _convert_headlines_to_df(headlines: list[dict]) -> pd.DataFrame:
     '''
     Convert the list of dictionary objects returned by standardisation functionality into a `pd.DataFrame` object
     '''
-    headlines_df = pd.DataFrame(headlines)
+    headlines_df = pd.DataFrame(headlines, columns=['publication_date', 'headline'])
+    headlines_df['publication_date'] = pd.to_datetime(headlines_df['publication_date'], utc=True)
     headlines_df['year'] = headlines_df['publication_date'].dt.year
     headlines_df['month'] = headlines_df['publication_date'].dt.month
     return headlines_df
 
-def _request(url: str, params: dict, delay: int = 0):
+def _request(url: str, params: dict, delay: int = 0, stats: RequestStats | None = None):
     '''
-    Wrapper function which calls `requests.get()` under the hood
+    Wrapper function which calls `requests.get()` under the hood (and records the request against `stats`, if specified)
     '''
     if delay > 0:
         logging.debug(f'Sleeping for {delay} seconds prior to making GET request (target endpoint: "{url}")')
         time.sleep(delay)
     res = requests.get(url, params)
     res.raise_for_status()
+    if stats is not None:
+        stats.record(len(res.content))
     deserialised = res.json()
     return deserialised
 
@@ -40,6 +69,26 @@ def _get_date_range(year: int, month: int):
     end = end - timedelta(days=1)
     return start.date(), end.date()
 
+def _iterate_months(start: date, end: date):
+    '''
+    Yield each `(year, month)` pair between the `start` and `end` dates (inclusive)
+    '''
+    year, month = start.year, start.month
+    while (year, month) <= (end.year, end.month):
+        yield year, month
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+def _filter_since(headlines_df: pd.DataFrame, since: datetime | None) -> pd.DataFrame:
+    '''
+    Retain only those headlines published strictly after the high-water mark `since` (naive timestamps are assumed to be UTC)
+    '''
+    if since is None:
+        return headlines_df
+    since = pd.Timestamp(since)
+    if since.tzinfo is None:
+        since = since.tz_localize('UTC')
+    return headlines_df[headlines_df['publication_date'] > since].reset_index(drop=True)
+
 def _standardise_guardian_headlines(res_deserialised: dict):
     '''
     Ingest raw JSON response from the Guardian API resource (`deserialised`) and standardise into a list of
@@ -80,7 +129,70 @@ def request_nyt_headlines(year: int, month: int, key: str) -> pd.DataFrame:
         raise err
     return headlines_df
 
-def request_guardian_headlines(year: int, month: int, key: str, n_pages: int | None = None) -> pd.DataFrame:
+def _guardian_params(start_date: date, end_date: date, key: str, page_size: int = GUARDIAN_MAX_PAGE_SIZE) -> dict:
+    '''
+    Parametrise a Guardian search between `start_date` and `end_date` (inclusive). No `show-*` parameters are requested as
+    the default response already carries the only fields used (i.e. `webTitle` and `webPublicationDate`).
+    '''
+    return {'api-key': key,
+            'page': 1,
+            'page-size': page_size,
+            'order-by': 'oldest', # NB: stable ordering, so that articles published mid-extraction do not shift pages
+            'from-date': str(start_date),
+            'to-date': str(end_date)}
+
+def _request_guardian_pages(start_date: date, end_date: date, key: str, first_page: dict | None = None, page_size: int = GUARDIAN_MAX_PAGE_SIZE, n_workers: int = 1, stats: RequestStats | None = None) -> list[dict]:
+    '''
+    Request every page of a Guardian search between `start_date` and `end_date` (inclusive). Once the first page has
+    revealed the number of pages, the remainder are requested by up to `n_workers` threads (in page order).
+
+    :param first_page: Deserialised response for the first page, if it has already been requested
+    :param n_workers: Number of pages requested in parallel (NB: each worker makes at most 4 requests per second)
+    '''
+    params = _guardian_params(start_date, end_date, key, page_size)
+    res = first_page or _request(GUARDIAN_URL, params, delay = 0.25, stats = stats)
+    headlines = _standardise_guardian_headlines(res)
+    # NB: results are ordered oldest first, so articles published mid-extraction are appended rather than shifting earlier pages
+    request_page = lambda n: _standardise_guardian_headlines(_request(GUARDIAN_URL, {**params, 'page': n}, delay = 0.25, stats = stats))
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        for page_headlines in executor.map(request_page, range(2, res['response']['pages'] + 1)):
+            headlines.extend(page_headlines)
+    return headlines
+
+def _request_guardian_window(start_date: date, end_date: date, key: str, n_pages: int | None = None, page_size: int = GUARDIAN_MAX_PAGE_SIZE, n_workers: int = 3, stats: RequestStats | None = None) -> pd.DataFrame:
+    '''
+    Get all of the headlines from the Guardian published between `start_date` and `end_date` (inclusive). The window is
+    requested as a single search, so every page but the last is full (i.e. the fewest requests possible); pages beyond the
+    first are requested in parallel.
+
+    :param start_date: First publication date of interest
+    :param end_date: Last publication date of interest
+    :param key: Developer key for Guardian API service
+    :param n_pages: Number of pages to search for; defaults to `None` in which case the number is detected from the API service
+    :param page_size: Number of headlines per page (defaults to the maximum the API allows)
+    :param n_workers: Number of pages requested in parallel (NB: each worker makes at most 4 requests per second)
+    :param stats: Object of class `RequestStats` against which requests are recorded; defaults to `None` (i.e. a new tally)
+    '''
+    stats = stats or RequestStats()
+    params = _guardian_params(start_date, end_date, key, page_size)
+    try:
+        if n_pages:
+            headline_list = []
+            for n in range(1, n_pages + 1):
+                params['page'] = n
+                res = _request(GUARDIAN_URL, params, delay = 0.25, stats = stats)
+                headline_list.append(_standardise_guardian_headlines(res))
+            headlines = list(itertools.chain.from_iterable(headline_list))
+        else:
+            init_res = _request(GUARDIAN_URL, params, stats = stats)
+            headlines = _request_guardian_pages(start_date, end_date, key, init_res, page_size, n_workers, stats)
+        headlines_df = _convert_headlines_to_df(headlines)
+    except RequestException as err:
+        raise err
+    logging.info(f'Requested {len(headlines_df)} headlines from the "Guardian" ({start_date} to {end_date}): {stats}')
+    return headlines_df
+
+def request_guardian_headlines(year: int, month: int, key: str, n_pages: int | None = None, stats: RequestStats | None = None) -> pd.DataFrame:
     '''
     Get all of the headlines from the Guardian for a specific `year` & `month`
 
@@ -88,31 +200,41 @@ def request_guardian_headlines(year: int, month: int, key: str, n_pages: int | N
     :param month: Month of interest
     :param key: Developer key for Guardian API service
     :param n_pages: Number of pages to search for; defaults to `None` in which case the number is detected from the API service
+    :param stats: Object of class `RequestStats` against which requests are recorded; defaults to `None`
     '''
     if not key:
         raise ValueError('Input variable `key` must be specified')
     start_date, end_date = _get_date_range(year, month)
-    url = 'https://content.guardianapis.com/search'
-    params = {'api-key': key,
-              'page': 1,
-              'page-size': 50,
-              'from-date': str(start_date),
-              'to-date': str(end_date)}
-    try:
-        if not n_pages:
-            init_res = _request(url, params)
-            n_pages = init_res['response']['pages'] 
-        headline_list = []
-        for n in range(1, n_pages + 1):
-            params['page'] = n
-            res = _request(url, params, delay = 0.25)
-            headlines = _standardise_guardian_headlines(res)
-            headline_list.append(headlines)
-        headlines = list(itertools.chain.from_iterable(headline_list))
-        headlines_df = _convert_headlines_to_df(headlines)
-    except RequestException as err:
-        raise err
-    return headlines_df
+    return _request_guardian_window(start_date, end_date, key, n_pages, stats=stats)
+
+def request_guardian_headlines_since(since: datetime, key: str, until: date | None = None) -> pd.DataFrame:
+    '''
+    Get the headlines from the Guardian published after the high-water mark `since` (i.e. incremental ingestion). The
+    `from-date`/`to-date` window only resolves to whole days, so the response is filtered down to `since` thereafter.
+
+    :param since: Timestamp of the latest headline already ingested (naive timestamps are assumed to be UTC)
+    :param key: Developer key for Guardian API service
+    :param until: Last publication date of interest; defaults to `None` in which case today's date is used
+    '''
+    if not key:
+        raise ValueError('Input variable `key` must be specified')
+    until = until or datetime.now(timezone.utc).date()
+    headlines_df = _request_guardian_window(since.date(), until, key)
+    return _filter_since(headlines_df, since)
+
+def request_nyt_headlines_since(since: datetime, key: str, until: date | None = None) -> pd.DataFrame:
+    '''
+    Get the headlines from the New York Times published after the high-water mark `since` (i.e. incremental ingestion). The
+    archive resource only serves whole months, so each month spanned is requested and diffed against `since` thereafter.
+
+    :param since: Timestamp of the latest headline already ingested (naive timestamps are assumed to be UTC)
+    :param key: Developer key for New York Times API service
+    :param until: Last publication date of interest; defaults to `None` in which case today's date is used
+    '''
+    until = until or datetime.now(timezone.utc).date()
+    headlines_dfs = [request_nyt_headlines(year, month, key) for year, month in _iterate_months(since.date(), until)]
+    headlines_df = pd.concat(headlines_dfs, ignore_index=True)
+    return _filter_since(headlines_df, since)
 
 if __name__ == '__main__':
     pass
\ No newline at end of file
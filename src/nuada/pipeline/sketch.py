@@ -0,0 +1,210 @@
+import heapq
+import json
+import math
+import struct
+import zlib
+import numpy as np
+import pandas as pd
+
+from dataclasses import dataclass
+
+_HASH_KEY = 'nuada-term-hash0' # NB: fixed 16-character key so that hashes (and hence sketches) are stable across processes
+
+@dataclass
+class SketchConfig:
+    '''
+    Configure the parameters for approximate (i.e. fixed memory) term counting (see `TermSketch()` for more detail).
+
+    :param epsilon: Additive error of each frequency estimate, expressed as a fraction of the total number of terms counted
+    :param delta: Probability that a frequency estimate exceeds the error bound implied by `epsilon`
+    :param capacity: Number of 'heavy hitters' (i.e. candidate top-k terms) to track
+    '''
+    epsilon: float = 0.0005
+    delta: float = 0.01
+    capacity: int = 1000
+
+    @property
+    def width(self) -> int:
+        return math.ceil(math.e / self.epsilon)
+
+    @property
+    def depth(self) -> int:
+        return math.ceil(math.log(1 / self.delta))
+
+    def __repr__(self) -> str:
+        return f'(Epsilon: {self.epsilon}, Delta: {self.delta}, Capacity: {self.capacity})'
+
+class CountMinSketch():
+    '''
+    Count-min sketch: a `depth` x `width` table of counters which over-estimates the frequency of any term by at most
+    `e / width` of the total count, with probability `1 - exp(-depth)`. Sketches of identical shape are merged by addition.
+    '''
+    def __init__(self, width: int, depth: int, table: np.ndarray | None = None):
+        self.width = width
+        self.depth = depth
+        self.table = table if table is not None else np.zeros((depth, width), dtype=np.int64)
+
+    def _locate(self, terms: pd.Series) -> np.ndarray:
+        '''
+        Map each term to one counter per row via double hashing (i.e. `h1 + i * h2`) of a single 64-bit hash
+        '''
+        hashes = pd.util.hash_array(np.asarray(terms, dtype=object), hash_key=_HASH_KEY)
+        h1, h2 = hashes & np.uint64(0xFFFFFFFF), (hashes >> np.uint64(32)) | np.uint64(1)
+        rows = np.arange(self.depth, dtype=np.uint64)[:, None]
+        return ((h1[None, :] + rows * h2[None, :]) % np.uint64(self.width)).astype(np.intp)
+
+    @property
+    def total(self) -> int:
+        return int(self.table[0].sum())
+
+    def update(self, terms: pd.Series, counts: np.ndarray) -> None:
+        '''
+        Increment the counters for each term in `terms` by the corresponding entry of `counts`
+        '''
+        columns = self._locate(terms)
+        for row in range(self.depth):
+            np.add.at(self.table[row], columns[row], counts)
+
+    def estimate(self, terms: pd.Series) -> np.ndarray:
+        '''
+        Estimate the frequency of each term in `terms` (never an under-estimate)
+        '''
+        columns = self._locate(terms)
+        return self.table[np.arange(self.depth)[:, None], columns].min(axis=0)
+
+    def merge(self, other: 'CountMinSketch') -> 'CountMinSketch':
+        if (self.width, self.depth) != (other.width, other.depth):
+            raise ValueError('Count-min sketches can only be merged if they share the same width and depth')
+        self.table += other.table
+        return self
+
+class SpaceSaving():
+    '''
+    SpaceSaving summary: tracks at most `capacity` candidate heavy hitters, each with an over-estimated count and the
+    maximum error of that count. Any term whose true frequency exceeds `total / capacity` is guaranteed to be tracked.
+    '''
+    def __init__(self, capacity: int, counts: dict[str, int] | None = None, errors: dict[str, int] | None = None):
+        self.capacity = capacity
+        self.counts = counts or {}
+        self.errors = errors or {term: 0 for term in self.counts}
+        self._heap = [(count, term) for term, count in self.counts.items()]
+        heapq.heapify(self._heap)
+
+    def _pop_min(self) -> tuple[int, str]:
+        '''
+        Pop the tracked term with the smallest count; stale heap entries (i.e. since incremented) are discarded lazily
+        '''
+        while True:
+            count, term = heapq.heappop(self._heap)
+            if self.counts.get(term) == count:
+                return count, term
+
+    @property
+    def floor(self) -> int:
+        '''
+        Smallest tracked count once the summary is full (i.e. the maximum count of any *untracked* term)
+        '''
+        return min(self.counts.values()) if len(self.counts) >= self.capacity else 0
+
+    def update(self, term: str, count: int = 1) -> None:
+        if term in self.counts:
+            self.counts[term] += count
+        elif len(self.counts) < self.capacity:
+            self.counts[term] = count
+            self.errors[term] = 0
+        else:
+            floor, victim = self._pop_min()
+            del self.counts[victim], self.errors[victim]
+            self.counts[term] = floor + count
+            self.errors[term] = floor
+        heapq.heappush(self._heap, (self.counts[term], term))
+        if len(self._heap) > 4 * self.capacity:
+            self._heap = [(count, term) for term, count in self.counts.items()]
+            heapq.heapify(self._heap)
+
+    def merge(self, other: 'SpaceSaving') -> 'SpaceSaving':
+        '''
+        Merge another summary into this one (terms missing from one summary are credited with that summary's floor)
+        '''
+        self_floor, other_floor = self.floor, other.floor
+        counts, errors = {}, {}
+        for term in self.counts.keys() | other.counts.keys():
+            counts[term] = self.counts.get(term, self_floor) + other.counts.get(term, other_floor)
+            errors[term] = self.errors.get(term, self_floor) + other.errors.get(term, other_floor)
+        retained = heapq.nlargest(self.capacity, counts, key=counts.get)
+        self.__init__(self.capacity, {term: counts[term] for term in retained}, {term: errors[term] for term in retained})
+        return self
+
+class TermSketch():
+    '''
+    Approximate term-frequency summary in fixed memory: a count-min sketch answers frequency queries for any term and a
+    SpaceSaving summary tracks the candidate top-k terms. Sketches are mergeable across pages, sources and months.
+    '''
+    def __init__(self, config: SketchConfig = SketchConfig()):
+        self.config = config
+        self.cms = CountMinSketch(config.width, config.depth)
+        self.heavy_hitters = SpaceSaving(config.capacity)
+
+    @property
+    def total(self) -> int:
+        return self.cms.total
+
+    def update(self, terms: pd.Series) -> 'TermSketch':
+        '''
+        Count each occurrence of each term in `terms` (e.g. the `term` column of a tokenized page of headlines)
+        '''
+        frequencies = terms.value_counts()
+        if frequencies.empty:
+            return self
+        self.cms.update(frequencies.index, frequencies.to_numpy())
+        for term, frequency in frequencies.items():
+            self.heavy_hitters.update(term, int(frequency))
+        return self
+
+    def estimate(self, terms: list[str]) -> pd.DataFrame:
+        '''
+        Estimate the frequency of each term in `terms`
+
+        :param terms: List of terms of interest
+        '''
+        return pd.DataFrame({'term': terms, 'frequency': self.cms.estimate(pd.Index(terms, dtype=object))})
+
+    def top_k(self, n: int = 10) -> pd.DataFrame:
+        '''
+        Estimate the `n` most frequent terms (`n` should not exceed the configured capacity), taking the tighter of the
+        SpaceSaving and count-min estimates for each candidate
+
+        :param n: Number of terms to return
+        '''
+        candidates = pd.Index(list(self.heavy_hitters.counts), dtype=object)
+        frequencies = np.minimum(self.cms.estimate(candidates), [self.heavy_hitters.counts[term] for term in candidates])
+        top_df = pd.DataFrame({'term': candidates, 'frequency': frequencies})
+        return top_df.sort_values(['frequency', 'term'], ascending=[False, True]).head(n).reset_index(drop=True)
+
+    def merge(self, other: 'TermSketch') -> 'TermSketch':
+        self.cms.merge(other.cms)
+        self.heavy_hitters.merge(other.heavy_hitters)
+        return self
+
+    def to_bytes(self) -> bytes:
+        '''
+        Serialise the sketch into a compressed binary payload (see `TermSketch.from_bytes()`)
+        '''
+        header = struct.pack('<ddIII', self.config.epsilon, self.config.delta, self.config.capacity, self.cms.width, self.cms.depth)
+        heavy_hitters = json.dumps([self.heavy_hitters.counts, self.heavy_hitters.errors]).encode('utf-8')
+        return zlib.compress(header + self.cms.table.tobytes() + heavy_hitters)
+
+    @classmethod
+    def from_bytes(cls, payload: bytes) -> 'TermSketch':
+        payload = zlib.decompress(payload)
+        epsilon, delta, capacity, width, depth = struct.unpack_from('<ddIII', payload)
+        offset = struct.calcsize('<ddIII')
+        table_size = width * depth * np.dtype(np.int64).itemsize
+        term_sketch = cls(SketchConfig(epsilon=epsilon, delta=delta, capacity=capacity))
+        term_sketch.cms = CountMinSketch(width, depth, np.frombuffer(payload[offset:offset + table_size], dtype=np.int64).reshape(depth, width).copy())
+        counts, errors = json.loads(payload[offset + table_size:].decode('utf-8'))
+        term_sketch.heavy_hitters = SpaceSaving(capacity, counts, errors)
+        return term_sketch
+
+if __name__ == '__main__':
+    pass
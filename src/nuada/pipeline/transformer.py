@@ -1,14 +1,50 @@
+import hashlib
 import pandas as pd
-import nltk
 
-from nltk.stem import PorterStemmer
-from nltk.corpus import stopwords
-from nltk.tokenize import word_tokenize
+from dataclasses import dataclass, field, replace
+from functools import lru_cache
+from .sketch import SketchConfig, TermSketch
+from .index import HeadlineIndex
+from .dedup import DedupConfig, deduplicate_headlines
+from .cache import TransformCache, _tokenizer_identity
+
+@dataclass(frozen=True) # NB: frozen (i.e. hashable) so that the stop words of each lexicon are only resolved once
+class Lexicon:
+    '''
+    Configure the terms eliminated during cleansing (see `_cleanse_terms()` for more detail).
+
+    :param language: Language of the `nltk` stop-word corpus (e.g. 'english' or 'spanish'); `None` for no corpus
+    :param stop_words: Additional (lower case) terms to eliminate, e.g. the name of the source itself
+    :param keep_words: (Lower case) terms to retain even if they are stop words in the corpus
+    '''
+    language: str | None = 'english'
+    stop_words: tuple[str, ...] = ()
+    keep_words: tuple[str, ...] = ()
+
+    def __repr__(self) -> str:
+        return f'(Language: {self.language}, Stop words: +{len(self.stop_words)}/-{len(self.keep_words)})'
+
+@dataclass
+class TransformConfig:
+    '''
+    Configure the parameters for transformation (see `transform()` for more detail).
+
+    :param dedup: Object of class `DedupConfig` applied to headlines prior to tokenization; defaults to `None` (i.e. no deduplication)
+    :param lexicon: Object of class `Lexicon` used to cleanse terms
+    :param lexicons: Dictionary of `Lexicon` objects (keyed by source alias) overriding `lexicon` for specific sources
+    '''
+    dedup: DedupConfig | None = None
+    lexicon: Lexicon = field(default_factory=Lexicon)
+    lexicons: dict[str, Lexicon] = field(default_factory=dict)
+
+    def __repr__(self) -> str:
+        return f'(Dedup: {self.dedup}, Lexicon: {self.lexicon}, Source lexicons: {list(self.lexicons)})'
 
 def _download_nltk_data(download_dir: str = '/tmp') -> None:
     '''
     Helper function to download pre-requisite tokenizer artifacts for tokenization purposes.
     '''
+    import nltk # NB: `nltk` is imported on demand (here and below) as it is slow to import
     try:
         nltk.data.path.append(download_dir)
         nltk.download('punkt', quiet=True, download_dir=download_dir)
@@ -16,35 +52,46 @@ def _download_nltk_data(download_dir: str = '/tmp') -> None:
     except IOError as err:
         raise err
 
-def _cleanse_cases(terms_df: pd.DataFrame) -> pd.DataFrame:
+@lru_cache(maxsize=None)
+def _stop_words(lexicon: Lexicon) -> frozenset[str]:
     '''
-    Standardise terms to lower case 
+    Stop words eliminated under `lexicon` (i.e. those of its corpus, plus and minus its own additions and exceptions)
     '''
-    terms_df['term'] = terms_df['term'].str.lower()
-    return terms_df
+    stop_words = set(lexicon.stop_words)
+    if lexicon.language is not None:
+        from nltk.corpus import stopwords
+        stop_words.update(stopwords.words(lexicon.language))
+    return frozenset(stop_words.difference(lexicon.keep_words))
 
-def _cleanse_stop_words(terms_df: pd.DataFrame) -> pd.DataFrame:
+def _cleanse_terms(terms_df: pd.DataFrame, lexicon: Lexicon = Lexicon()) -> pd.DataFrame:
     '''
-    Eliminate 'stop words'
-    '''
-    stop_words = set(stopwords.words('english')) # NB: set-based usage improves lookup efficiency over list-based usage
-    terms_df = terms_df[~terms_df['term'].isin(stop_words)]
-    return terms_df
+    Standardise terms to lower case and eliminate 'stop words' and terms which are not purely alphabetical (e.g. numerics
+    and punctuation) in a single pass.
 
-def _cleanse_numerics(terms_df: pd.DataFrame) -> pd.DataFrame:
-    '''
-    Eliminate numeric characters; should only be left with alphabetical characters
+    NB: terms are factorised so that each check is applied once per distinct term (i.e. the vocabulary) rather than once
+    per occurrence; the results are then mapped back to the occurrences by their codes.
+
+    :param terms_df: `pd.DataFrame` object with *at least* column `term`
+    :param lexicon: Object of class `Lexicon`
     '''
-    terms_df = terms_df[terms_df['term'].apply(lambda xx: xx.isalpha())]
-    return terms_df
+    codes, vocabulary = pd.factorize(terms_df['term'])
+    vocabulary = pd.Series(vocabulary).str.lower()
+    retained = (vocabulary.str.isalpha() & ~vocabulary.isin(_stop_words(lexicon))).to_numpy()
+    mask = (codes >= 0) & retained[codes] # NB: code -1 denotes a missing term (e.g. a headline without tokens)
+    return terms_df[mask].assign(term=vocabulary.take(codes[mask]).set_axis(terms_df.index[mask]))
 
-def _tokenize_headlines(headlines_df: pd.DataFrame) -> pd.DataFrame:
+def _tokenize_headlines(headlines_df: pd.DataFrame, cache: TransformCache | None = None) -> pd.DataFrame:
     '''
     Ingests dataframe of headlines and expands each 'term' contained within the headline into a separate row.
 
     :param headlines_df: `pd.DataFrame` object with *at least* column `headline`
+    :param cache: Object of class `TransformCache` from which previously tokenized headlines are served; defaults to `None`
     '''
-    headlines_df['term'] = headlines_df['headline'].apply(word_tokenize)
+    from nltk.tokenize import word_tokenize
+    if cache is not None:
+        headlines_df['term'] = cache.tokenize(headlines_df['headline'], word_tokenize)
+    else:
+        headlines_df['term'] = headlines_df['headline'].apply(word_tokenize)
     terms_df = headlines_df.explode('term')
     return terms_df
 
@@ -57,18 +104,57 @@ def _aggregate_terms(terms_df: pd.DataFrame, grain: list[str] = ['term', 'year',
     aggregation = terms_df.groupby(by=grain).size().reset_index(name='frequency')
     return aggregation
 
-def transform(headlines_df: pd.DataFrame) -> pd.DataFrame:
+def transform(headlines_df: pd.DataFrame, index: HeadlineIndex | None = None, source_alias: str | None = None, config: TransformConfig = TransformConfig(), cache: TransformCache | None = None) -> pd.DataFrame:
     '''
     Transform a `headlines_df` object (as implemented in `nuada.pipeline.resources`) into a tokenized term-frequency matrix
+
+    :param headlines_df: `pd.DataFrame` object with *at least* column `headline`
+    :param index: Object of class `HeadlineIndex` into which the headlines are archived prior to aggregation; defaults to `None` (i.e. no archival)
+    :param source_alias: A string-based description of the media source (required if `index` is specified; also selects the source's lexicon, if any)
+    :param config: Object of class `TransformConfig`
+    :param cache: Object of class `TransformCache` memoising results (and tokens) between invocations; defaults to `None` (i.e. no caching)
     '''
+    if index is not None:
+        if not source_alias:
+            raise ValueError('Input variable `source_alias` must be specified alongside `index`')
+        index.add(source_alias, headlines_df)
+    lexicon = config.lexicons.get(source_alias, config.lexicon)
     _download_nltk_data()
+    if cache is not None:
+        from nltk.tokenize import word_tokenize
+        # NB: only the lexicon applicable to this source forms part of the key, so that configuring another source's lexicon does not invalidate it;
+        # the tokenizer and the stop words it resolves to are keyed too, as either may change with the installed NLTK data
+        stop_words = hashlib.sha256('\n'.join(sorted(_stop_words(lexicon))).encode('utf-8')).hexdigest()
+        key = cache.key(headlines_df, replace(config, lexicon=lexicon, lexicons={}), (_tokenizer_identity(word_tokenize), stop_words))
+        terms_df = cache.get(key)
+        if terms_df is not None:
+            return terms_df
+    if config.dedup is not None:
+        headlines_df = deduplicate_headlines(headlines_df, config.dedup)
     terms_df = (headlines_df
-                    .pipe(_tokenize_headlines)
-                    .pipe(_cleanse_cases)
-                    .pipe(_cleanse_stop_words)
-                    .pipe(_cleanse_numerics)
+                    .pipe(_tokenize_headlines, cache)
+                    .pipe(_cleanse_terms, lexicon)
                     .pipe(_aggregate_terms))
+    if cache is not None:
+        cache.put(key, terms_df)
     return terms_df
 
+def sketch_terms(headlines_df: pd.DataFrame, config: SketchConfig = SketchConfig(), term_sketch: TermSketch | None = None, lexicon: Lexicon = Lexicon()) -> TermSketch:
+    '''
+    Approximate counterpart to `transform()`: counts the cleansed terms of `headlines_df` into a fixed-memory `TermSketch`
+    rather than an exact term-frequency matrix (suitable for very large or unbounded corpora)
+
+    :param headlines_df: `pd.DataFrame` object with *at least* column `headline`
+    :param config: Object of class `SketchConfig` (ignored if `term_sketch` is specified)
+    :param term_sketch: Existing `TermSketch` to accumulate into (e.g. when streaming pages); defaults to `None` in which case a new sketch is created
+    :param lexicon: Object of class `Lexicon` used to cleanse terms
+    '''
+    _download_nltk_data()
+    terms_df = (headlines_df
+                    .pipe(_tokenize_headlines)
+                    .pipe(_cleanse_terms, lexicon))
+    term_sketch = term_sketch or TermSketch(config)
+    return term_sketch.update(terms_df['term'])
+
 if __name__ == '__main__':  
     pass
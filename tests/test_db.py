@@ -1,6 +1,12 @@
+import asyncio
+import pytest
 import pandas as pd
-from nuada.db import BatchConfig
-from nuada.models import Control, Term, Source
+from datetime import datetime, timedelta
+from sqlalchemy import update
+from nuada.db import CLAIM_LEASE, BatchConfig, DatabaseConfig, DatabaseManager, _prepare_terms, _term_partition_bounds
+from nuada.pipeline.sketch import TermSketch
+from nuada.matrix import TermMatrix
+from nuada.models import Control, Term, Source, Progress
 
 def test_insert_batch_success(db_manager):
     '''
@@ -50,3 +56,373 @@ def test_insert_batch_existing_source(db_manager):
 
     source_records = db_manager.db_session.query(Source).all()
     assert len(source_records) == 1
+
+def test_insert_increment_merges_frequencies(db_manager):
+    '''
+    Given successive incremental extracts, term frequencies are accumulated and the source watermark is advanced
+    '''
+    first = {'Guardian': pd.DataFrame({'term': ['apple', 'banana'], 'year': [2023, 2023], 'month': [9, 9], 'frequency': [1, 2]})}
+    second = {'Guardian': pd.DataFrame({'term': ['apple', 'cherry'], 'year': [2023, 2023], 'month': [9, 10], 'frequency': [3, 4]})}
+    db_manager.insert_increment(first, {'Guardian': datetime(2023, 9, 30, 12)})
+    control_ids = db_manager.insert_increment(second, {'Guardian': datetime(2023, 10, 1, 8)})
+
+    assert len(control_ids) == 2
+    frequencies = {term.term: term.frequency for term in db_manager.db_session.query(Term).all()}
+    assert frequencies == {'apple': 4, 'banana': 2, 'cherry': 4}
+    assert db_manager.get_watermark('Guardian') == datetime(2023, 10, 1, 8)
+    assert db_manager.get_watermark('New York Times') is None
+
+def test_insert_increment_skips_completed_months(db_manager):
+    '''
+    Given a month has already been loaded in full, incremental extracts for that month are ignored
+    '''
+    db_manager.insert_batch(BatchConfig(year=2023, month=9), {'Guardian': pd.DataFrame({'term': ['apple'], 'frequency': [10]})})
+    increment = {'Guardian': pd.DataFrame({'term': ['apple'], 'year': [2023], 'month': [9], 'frequency': [5]})}
+    assert db_manager.insert_increment(increment, {'Guardian': datetime(2023, 9, 30)}) == []
+
+    term_record = db_manager.db_session.query(Term).one()
+    assert term_record.frequency == 10
+
+def test_insert_sketch_merges(db_manager):
+    '''
+    Given successive sketches for the same source and period, the persisted sketch is the merge of both
+    '''
+    batch_config = BatchConfig(year=2023, month=9)
+    db_manager.insert_sketch(batch_config, 'Guardian', TermSketch().update(pd.Series(['apple', 'apple', 'banana'])))
+    db_manager.insert_sketch(batch_config, 'Guardian', TermSketch().update(pd.Series(['apple'])))
+    db_manager.insert_sketch(batch_config, 'New York Times', TermSketch().update(pd.Series(['banana'])))
+
+    guardian_sketch = db_manager.get_sketch(2023, 9, 'Guardian')
+    assert guardian_sketch.estimate(['apple'])['frequency'].tolist() == [3]
+    assert db_manager.get_sketch(2023, 9).total == 5
+    assert db_manager.get_sketch(2023, 10) is None
+
+def test_insert_batch_isolates_failing_source(db_manager):
+    '''
+    Given one invalid source extract, the remaining sources are still loaded and the batch registers a status of 'Fatal'
+    '''
+    batch_data = {'New York Times': pd.DataFrame({'term': ['apple', 'banana'], 'frequency': [10, 20]}),
+                  'Guardian': pd.DataFrame({'term_XYZ': ['apple'], 'frequency': [5]})}
+    control_id = db_manager.insert_batch(BatchConfig(year=2022, month=1), batch_data)
+
+    control_record = db_manager.db_session.get(Control, control_id)
+    assert control_record.status == 'Fatal'
+    assert control_record.commentary.startswith('Guardian')
+    assert db_manager.db_session.query(Term).count() == 2
+
+def test_insert_batch_resumes_from_last_chunk(db_manager):
+    '''
+    Given a batch fails part way through a source, re-running the batch resumes from the last committed chunk
+    '''
+    batch_config = BatchConfig(year=2022, month=1, chunk_size=2)
+    invalid_data = {'New York Times': pd.DataFrame({'term': ['apple', 'banana', 'cherry', 'damson'], 'frequency': [1, 2, 'XYZ', 4]})}
+    db_manager.insert_batch(batch_config, invalid_data)
+
+    progress_record = db_manager.db_session.query(Progress).one()
+    assert progress_record.n_terms == 2
+    assert sorted(term.term for term in db_manager.db_session.query(Term).all()) == ['apple', 'banana']
+
+    valid_data = {'New York Times': pd.DataFrame({'term': ['apple', 'banana', 'cherry', 'damson'], 'frequency': [1, 2, 3, 4]})}
+    control_id = db_manager.insert_batch(batch_config, valid_data)
+
+    assert db_manager.db_session.get(Control, control_id).status == 'Success'
+    assert db_manager.db_session.query(Progress).one().n_terms == 4
+    assert {term.term: term.frequency for term in db_manager.db_session.query(Term).all()} == {'apple': 1, 'banana': 2, 'cherry': 3, 'damson': 4}
+
+def test_async_insert_batches(tmp_path):
+    '''
+    Given several batches loaded concurrently, every (source, control) partition is written and each month succeeds
+    '''
+    pytest.importorskip('aiosqlite')
+    from nuada.db_async import AsyncDatabaseManager
+
+    batches = [(BatchConfig(year=2022, month=month, chunk_size=2),
+                {'New York Times': pd.DataFrame({'term': ['apple', 'banana', 'cherry'], 'frequency': [1, 2, 3]}),
+                 'Guardian': pd.DataFrame({'term': ['apple', 'damson'], 'frequency': [4, 5]})}) for month in range(1, 7)]
+
+    async def load():
+        async with AsyncDatabaseManager(DatabaseConfig(db_name=str(tmp_path / 'nuada.db')), n_writers=3) as db:
+            return await db.insert_batches(batches)
+
+    control_ids = asyncio.run(load())
+    db_manager = DatabaseManager(DatabaseConfig(db_name=str(tmp_path / 'nuada.db')))
+    assert len(set(control_ids)) == 6
+    assert {control.status for control in db_manager.db_session.query(Control).all()} == {'Success'}
+    assert db_manager.db_session.query(Term).count() == 6 * 5
+    assert db_manager.db_session.query(Source).count() == 2
+
+def test_async_claim_is_exclusive(tmp_path):
+    '''
+    Given two writers racing for the same month, only one claims it and the other skips the batch
+    '''
+    pytest.importorskip('aiosqlite')
+    from nuada.db_async import AsyncDatabaseManager
+
+    batch_data = {'New York Times': pd.DataFrame({'term': ['apple', 'banana'], 'frequency': [10, 20]})}
+
+    async def load():
+        async with AsyncDatabaseManager(DatabaseConfig(db_name=str(tmp_path / 'nuada.db'))) as db:
+            return await asyncio.gather(db.insert_batch(BatchConfig(year=2022, month=1), batch_data),
+                                        db.insert_batch(BatchConfig(year=2022, month=1), batch_data))
+
+    control_ids = asyncio.run(load())
+    assert control_ids.count(None) == 1
+    assert DatabaseManager(DatabaseConfig(db_name=str(tmp_path / 'nuada.db'))).db_session.query(Term).count() == 2
+
+def test_async_batch_failures(tmp_path, monkeypatch):
+    '''
+    Given a batch which is cancelled mid-load, its month is released as 'Fatal'; given a batch which fails outright, the
+    other batches are still loaded
+    '''
+    pytest.importorskip('aiosqlite')
+    from nuada.db_async import AsyncDatabaseManager
+
+    batch_data = {'New York Times': pd.DataFrame({'term': ['apple', 'banana'], 'frequency': [10, 20]})}
+    db_config = DatabaseConfig(db_name=str(tmp_path / 'nuada.db'))
+    started = asyncio.Event()
+    insert_terms, claim_control = AsyncDatabaseManager._insert_terms, AsyncDatabaseManager._claim_control
+
+    async def stalled_insert_terms(self, *args):
+        started.set()
+        await asyncio.Event().wait()
+
+    async def failing_claim_control(self, session, year, month, commentary):
+        if month == 2:
+            raise RuntimeError('Connection lost')
+        return await claim_control(self, session, year, month, commentary)
+
+    async def cancel():
+        async with AsyncDatabaseManager(db_config) as db:
+            task = asyncio.create_task(db.insert_batch(BatchConfig(year=2022, month=1), batch_data))
+            await started.wait()
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+    monkeypatch.setattr(AsyncDatabaseManager, '_insert_terms', stalled_insert_terms)
+    asyncio.run(cancel())
+    assert DatabaseManager(db_config).db_session.query(Control.status).scalar() == 'Fatal'
+
+    async def load():
+        async with AsyncDatabaseManager(db_config) as db:
+            return await db.insert_batches([(BatchConfig(year=2022, month=month), batch_data) for month in (1, 2, 3)])
+
+    monkeypatch.setattr(AsyncDatabaseManager, '_insert_terms', insert_terms)
+    monkeypatch.setattr(AsyncDatabaseManager, '_claim_control', failing_claim_control)
+    control_ids = asyncio.run(load())
+    assert control_ids[1] is None and None not in (control_ids[0], control_ids[2])
+    db_manager = DatabaseManager(db_config)
+    assert {control.month: control.status for control in db_manager.db_session.query(Control).all()} == {1: 'Success', 3: 'Success'}
+
+def test_term_matrix_updates_on_batch(tmp_path):
+    '''
+    Given a materialised term matrix, completed batches are recorded and agree with a rebuild from the `term` table
+    '''
+    term_matrix = TermMatrix(str(tmp_path / 'matrix'))
+    db_manager = DatabaseManager(DatabaseConfig(), term_matrix=term_matrix)
+    for month, (nyt, guardian) in enumerate([([1, 2], [2, 4]), ([2, 4], [3, 1]), ([3, 8], [4, 2])], start=1):
+        batch_data = {'New York Times': pd.DataFrame({'term': ['apple', 'banana'], 'frequency': nyt}),
+                      'Guardian': pd.DataFrame({'term': ['apple', 'banana'], 'frequency': guardian})}
+        db_manager.insert_batch(BatchConfig(year=2022, month=month), batch_data)
+
+    assert term_matrix.shape == (2, 3, 2)
+    assert term_matrix.frequencies('Guardian').loc['banana'].tolist() == [4, 1, 2]
+    correlation = term_matrix.source_correlation('New York Times', 'Guardian')
+    assert correlation['apple'] == pytest.approx(1.0)
+    assert correlation['banana'] == pytest.approx(pd.Series([2, 4, 8]).corr(pd.Series([4, 1, 2])))
+    divergence = term_matrix.divergence('New York Times', 'Guardian').set_index('term')['divergence']
+    assert divergence['banana'] == pytest.approx(14 / 20 - 7 / 16)
+
+    rebuilt = TermMatrix.build(str(tmp_path / 'rebuilt'), db_manager.db_session)
+    reopened = TermMatrix(str(tmp_path / 'matrix'))
+    for term_matrix_copy in (rebuilt, reopened):
+        assert term_matrix_copy.frequencies('New York Times').equals(term_matrix.frequencies('New York Times'))
+
+def test_term_matrix_grows(tmp_path):
+    '''
+    Given more terms and periods than the initial capacity, the matrix grows without losing recorded frequencies
+    '''
+    term_matrix = TermMatrix(str(tmp_path / 'matrix'))
+    terms = [f'term{n}' for n in range(3000)]
+    for month in range(1, 13):
+        term_matrix.update(2000 + month, month, {'Guardian': pd.DataFrame({'term': terms[:month * 250], 'frequency': month})})
+    frequencies = term_matrix.frequencies('Guardian')
+    assert frequencies.shape == (3000, 12)
+    assert frequencies.loc['term0'].tolist() == list(range(1, 13))
+    assert frequencies.loc['term2999'].tolist() == [0] * 11 + [12]
+
+def test_get_terms(db_manager):
+    '''
+    Terms are read for a given period (and, optionally, source) via the read session, which defaults to the primary
+    '''
+    batch_data = {'New York Times': pd.DataFrame({'term': ['apple', 'banana'], 'frequency': [10, 20]}),
+                  'Guardian': pd.DataFrame({'term': ['apple'], 'frequency': [5]})}
+    db_manager.insert_batch(BatchConfig(year=2022, month=1), batch_data)
+    db_manager.insert_batch(BatchConfig(year=2022, month=2), {'Guardian': pd.DataFrame({'term': ['cherry'], 'frequency': [1]})})
+
+    assert db_manager.read_session is db_manager.db_session
+    assert len(db_manager.get_terms(2022, 1)) == 3
+    assert db_manager.get_terms(2022, 1, 'Guardian').to_dict(orient='records') == [{'source': 'Guardian', 'term': 'apple', 'frequency': 5}]
+    assert db_manager.get_terms(2023, 1).empty
+
+def test_term_partitioning(caplog):
+    '''
+    Partitions of the `term` table span `term_partition_size` control records; partitioning is ignored (with a warning) outside PostgreSQL
+    '''
+    assert _term_partition_bounds(1, 12) == (1, 13)
+    assert _term_partition_bounds(12, 12) == (1, 13)
+    assert _term_partition_bounds(13, 12) == (13, 25)
+
+    db_manager = DatabaseManager(DatabaseConfig(term_partition_size=12))
+    assert 'not supported' in caplog.text
+    assert db_manager.term_partition_size is None
+    db_manager.insert_batch(BatchConfig(year=2022, month=1), {'Guardian': pd.DataFrame({'term': ['apple'], 'frequency': [5]})})
+    assert db_manager.db_session.query(Term).count() == 1
+
+def test_insert_batch_retry_with_different_extract(db_manager):
+    '''
+    Given a batch fails part way through a source and is retried with a different extract (e.g. headlines requested afresh),
+    the terms recorded are replaced by the new extract rather than resumed by position
+    '''
+    batch_config = BatchConfig(year=2022, month=1, chunk_size=2)
+    invalid_data = {'New York Times': pd.DataFrame({'term': ['banana', 'cherry', 'damson'], 'frequency': [2, 3, 'XYZ']})}
+    control_id = db_manager.insert_batch(batch_config, invalid_data)
+    assert sorted(term.term for term in db_manager.db_session.query(Term).all()) == ['banana', 'cherry']
+    _, digest = _prepare_terms(invalid_data['New York Times'])
+    assert db_manager._get_progress(source_id=1, control_id=control_id, digest=digest) == 2 # NB: i.e. an identical extract resumes
+
+    valid_data = {'New York Times': pd.DataFrame({'term': ['apple', 'banana', 'cherry', 'damson'], 'frequency': [1, 5, 3, 4]})}
+    control_id = db_manager.insert_batch(batch_config, valid_data)
+
+    assert db_manager.db_session.get(Control, control_id).status == 'Success'
+    assert {term.term: term.frequency for term in db_manager.db_session.query(Term).all()} == {'apple': 1, 'banana': 5, 'cherry': 3, 'damson': 4}
+
+def test_insert_batch_finalises_incremental_month(db_manager):
+    '''
+    Given a month loaded incrementally, a subsequent full batch replaces the partial counts and marks the month as 'Success'
+    '''
+    increment = {'Guardian': pd.DataFrame({'term': ['apple', 'banana'], 'year': [2023, 2023], 'month': [9, 9], 'frequency': [3, 1]})}
+    db_manager.insert_increment(increment, {'Guardian': datetime(2023, 9, 15)})
+
+    batch_data = {'Guardian': pd.DataFrame({'term': ['apple', 'cherry'], 'frequency': [50, 7]})}
+    control_id = db_manager.insert_batch(BatchConfig(year=2023, month=9), batch_data)
+
+    assert db_manager.db_session.get(Control, control_id).status == 'Success'
+    assert {term.term: term.frequency for term in db_manager.db_session.query(Term).all()} == {'apple': 50, 'cherry': 7}
+
+def test_claim_lease(tmp_path):
+    '''
+    Given a month claimed by another loader, it is skipped by both the synchronous and asynchronous loaders until the
+    claim's lease lapses (e.g. its loader crashed); months loaded incrementally remain claimable
+    '''
+    pytest.importorskip('aiosqlite')
+    from nuada.db_async import AsyncDatabaseManager
+
+    db_config = DatabaseConfig(db_name=str(tmp_path / 'nuada.db'))
+    db_manager = DatabaseManager(db_config)
+    batch_data = {'Guardian': pd.DataFrame({'term': ['apple'], 'frequency': [5]})}
+    control_id, _, claimed = db_manager._claim_control(2022, 1)
+    assert claimed
+    assert db_manager._claim_control(2022, 1) == (control_id, 'Loading', False)
+    assert db_manager.db_session.query(Term).count() == 0
+
+    async def load(batch_config):
+        async with AsyncDatabaseManager(db_config) as db:
+            return await db.insert_batch(batch_config, batch_data)
+
+    assert asyncio.run(load(BatchConfig(year=2022, month=1))) is None
+    db_manager.db_session.execute(update(Control).values(timestamp=datetime.now() - CLAIM_LEASE - timedelta(minutes=1)))
+    db_manager.db_session.commit()
+    assert db_manager.insert_batch(BatchConfig(year=2022, month=1), batch_data) == control_id
+    assert db_manager.db_session.get(Control, control_id).status == 'Success'
+
+    db_manager.insert_increment({'Guardian': pd.DataFrame({'term': ['apple'], 'year': [2022], 'month': [2], 'frequency': [1]})},
+                                {'Guardian': datetime(2022, 2, 10)})
+    assert asyncio.run(load(BatchConfig(year=2022, month=2))) is not None
+    assert db_manager.get_terms(2022, 2)['frequency'].tolist() == [5]
+
+def test_term_matrix_updates_on_increment_and_async_batch(tmp_path):
+    '''
+    Given a materialised term matrix, months merged incrementally or loaded asynchronously are recorded too
+    '''
+    pytest.importorskip('aiosqlite')
+    from nuada.db_async import AsyncDatabaseManager
+
+    db_config = DatabaseConfig(db_name=str(tmp_path / 'nuada.db'))
+    term_matrix = TermMatrix(str(tmp_path / 'matrix'))
+    db_manager = DatabaseManager(db_config, term_matrix=term_matrix)
+    for frequency in (2, 3):
+        db_manager.insert_increment({'Guardian': pd.DataFrame({'term': ['apple'], 'year': [2022], 'month': [1], 'frequency': [frequency]})},
+                                    {'Guardian': datetime(2022, 1, 10)})
+    assert term_matrix.frequencies('Guardian').loc['apple'].tolist() == [5]
+
+    async def load():
+        async with AsyncDatabaseManager(db_config, term_matrix=term_matrix) as db:
+            return await db.insert_batch(BatchConfig(year=2022, month=2), {'Guardian': pd.DataFrame({'term': ['apple'], 'frequency': [7]})})
+
+    asyncio.run(load())
+    assert term_matrix.frequencies('Guardian').loc['apple'].tolist() == [5, 7]
+    rebuilt = TermMatrix.build(str(tmp_path / 'rebuilt'), db_manager.read_session)
+    assert rebuilt.frequencies('Guardian').equals(term_matrix.frequencies('Guardian'))
+
+def test_insert_increment_is_atomic(db_manager):
+    '''
+    Given an incremental extract whose second source fails, nothing is merged and no watermark advances, so a retry does not double count
+    '''
+    first = {'Guardian': pd.DataFrame({'term': ['apple'], 'year': [2023], 'month': [9], 'frequency': [1]})}
+    db_manager.insert_increment(first, {'Guardian': datetime(2023, 9, 29)})
+
+    second = {'Guardian': pd.DataFrame({'term': ['apple', 'banana'], 'year': [2023, 2023], 'month': [9, 10], 'frequency': [1, 1]}),
+              'New York Times': pd.DataFrame({'term': ['apple'], 'year': [2023], 'month': [11], 'frequency': ['XYZ']})}
+    with pytest.raises(ValueError):
+        db_manager.insert_increment(second, {'Guardian': datetime(2023, 10, 2), 'New York Times': datetime(2023, 11, 2)})
+
+    assert {term.term: term.frequency for term in db_manager.db_session.query(Term).all()} == {'apple': 1}
+    assert db_manager.get_watermark('Guardian') == datetime(2023, 9, 29)
+    assert db_manager.get_watermark('New York Times') is None
+
+def test_insert_batch_replaces_increment_after_failure(db_manager, monkeypatch):
+    '''
+    Given a batch which failed part way through, an increment merged into the month means the retry replaces (rather than
+    resumes) the source's terms
+    '''
+    import nuada.db
+    renew_statement, n_chunks = nuada.db._renew_statement, []
+    def failing_renew_statement(control_id):
+        n_chunks.append(control_id)
+        if len(n_chunks) == 2:
+            raise RuntimeError('Connection lost')
+        return renew_statement(control_id)
+
+    batch_config = BatchConfig(year=2023, month=9, chunk_size=1)
+    batch_data = {'Guardian': pd.DataFrame({'term': ['apple', 'damson'], 'frequency': [10, 40]})}
+    monkeypatch.setattr(nuada.db, '_renew_statement', failing_renew_statement)
+    control_id = db_manager.insert_batch(batch_config, batch_data)
+    assert db_manager.db_session.get(Control, control_id).status == 'Fatal'
+
+    increment = {'Guardian': pd.DataFrame({'term': ['apple', 'damson'], 'year': [2023, 2023], 'month': [9, 9], 'frequency': [1, 1]})}
+    assert db_manager.insert_increment(increment, {'Guardian': datetime(2023, 9, 30)}) == [control_id]
+    db_manager.insert_batch(batch_config, batch_data)
+
+    assert db_manager.db_session.get(Control, control_id).status == 'Success'
+    assert {term.term: term.frequency for term in db_manager.db_session.query(Term).all()} == {'apple': 10, 'damson': 40}
+
+def test_insert_increment_skips_claimed_month(db_manager):
+    '''
+    Given a month claimed by a batch load, an increment leaves both its status and its terms untouched
+    '''
+    control_id, _, _ = db_manager._claim_control(2023, 9)
+    increment = {'Guardian': pd.DataFrame({'term': ['apple'], 'year': [2023], 'month': [9], 'frequency': [1]})}
+    assert db_manager.insert_increment(increment, {'Guardian': datetime(2023, 9, 30)}) == []
+    assert db_manager.db_session.get(Control, control_id).status == 'Loading'
+    assert db_manager.db_session.query(Term).count() == 0
+
+def test_insert_sketch_replaces(db_manager):
+    '''
+    Given a full month's sketch is recorded again (e.g. the month is re-run), it replaces rather than doubles the recorded counts
+    '''
+    batch_config = BatchConfig(year=2023, month=9)
+    term_sketch = TermSketch().update(pd.Series(['apple', 'apple', 'banana']))
+    for _ in range(2):
+        db_manager.insert_sketch(batch_config, 'Guardian', term_sketch, replace=True)
+    assert db_manager.get_sketch(2023, 9, 'Guardian').total == 3
@@ -1,5 +1,15 @@
+import os
+import sqlite3
+import numpy as np
 import pandas as pd
-from nuada.pipeline.transformer import _download_nltk_data, _tokenize_headlines, _cleanse_cases, _cleanse_stop_words, _cleanse_numerics, _aggregate_terms, transform
+from datetime import date, datetime
+from nuada.pipeline.transformer import _download_nltk_data, _tokenize_headlines, _cleanse_terms, _aggregate_terms, transform, Lexicon, TransformConfig
+from nuada.pipeline import resources
+from nuada.pipeline.resources import RequestStats, _convert_headlines_to_df, _filter_since
+from nuada.pipeline.sketch import SketchConfig, TermSketch
+from nuada.pipeline.index import HeadlineIndex
+from nuada.pipeline.dedup import DedupConfig, deduplicate_headlines, deduplicate_sources
+from nuada.pipeline.cache import TransformCache
 
 def test_download_nltk_data(tmp_path):
     '''
@@ -16,7 +26,7 @@ def test_cleanse_cases():
     '''
     input_df = pd.DataFrame({'term': ['Hello', 'World']})
     expected_output_df = pd.DataFrame({'term': ['hello', 'world']})
-    assert _cleanse_cases(input_df).equals(expected_output_df)
+    assert _cleanse_terms(input_df, Lexicon(language=None)).equals(expected_output_df)
 
 def test_cleanse_numerics():
     '''
@@ -24,7 +34,26 @@ def test_cleanse_numerics():
     '''
     input_df = pd.DataFrame({'term': ['apple', '123banana', 'grape456']})
     expected_output_df = pd.DataFrame({'term': ['apple']})
-    assert _cleanse_numerics(input_df).equals(expected_output_df)
+    assert _cleanse_terms(input_df, Lexicon(language=None)).equals(expected_output_df)
+
+def test_cleanse_stop_words():
+    '''
+    Verifies that stop words are eliminated per lexicon, regardless of case, and that missing terms are dropped
+    '''
+    input_df = pd.DataFrame({'term': ['The', 'Guardian', 'reports', None, 'the', 'Reports']}, index=[0, 0, 0, 1, 2, 2])
+    lexicon = Lexicon(language=None, stop_words=('the', 'guardian', 'reports'), keep_words=('reports',))
+    expected_output_df = pd.DataFrame({'term': ['reports', 'reports']}, index=[0, 2])
+    assert _cleanse_terms(input_df, lexicon).equals(expected_output_df)
+    assert _cleanse_terms(input_df, Lexicon(language=None))['term'].tolist() == ['the', 'guardian', 'reports', 'the', 'reports']
+
+def test_transform_cache_key_lexicon(tmp_path):
+    '''
+    Verifies that the transform cache is keyed by the lexicon applicable to the source being transformed
+    '''
+    cache = TransformCache(str(tmp_path / 'cache'))
+    headlines_df = pd.DataFrame({'headline': ['apple banana'], 'year': 2023, 'month': 9})
+    assert cache.key(headlines_df, TransformConfig()) != cache.key(headlines_df, TransformConfig(lexicon=Lexicon(language='spanish')))
+    cache.close()
 
 def test_tokenize_headlines(sample_headlines_df):
     '''
@@ -58,3 +87,266 @@ def test_transform(sample_headlines_df):
     assert aggregated_df.loc[aggregated_df['term'] == 'apple', 'frequency'].values[0] == 2
     assert aggregated_df.loc[aggregated_df['term'] == 'orange', 'frequency'].values[0] == 2
     assert aggregated_df.loc[aggregated_df['term'] == 'banana', 'frequency'].values[0] == 3
+
+def test_filter_since():
+    '''
+    Verifies that only headlines published strictly after the high-water mark are retained
+    '''
+    headlines_df = _convert_headlines_to_df([{'publication_date': pd.to_datetime('2023-09-01T08:00:00Z'), 'headline': 'apple'},
+                                             {'publication_date': pd.to_datetime('2023-09-01T12:00:00Z'), 'headline': 'banana'}])
+    assert _filter_since(headlines_df, datetime(2023, 9, 1, 8))['headline'].tolist() == ['banana']
+    assert len(_filter_since(headlines_df, None)) == 2
+
+def _zipf_terms(n_terms: int, n_occurrences: int, seed: int) -> pd.Series:
+    rng = np.random.default_rng(seed)
+    ranks = rng.zipf(1.3, size=n_occurrences)
+    return pd.Series([f'term{rank % n_terms}' for rank in ranks])
+
+def test_term_sketch_accuracy():
+    '''
+    Verifies that approximate frequencies never under-estimate and respect the configured error bound against exact counts
+    '''
+    config = SketchConfig(epsilon=0.001, delta=0.01, capacity=100)
+    terms = _zipf_terms(n_terms=20000, n_occurrences=50000, seed=1)
+    exact = terms.value_counts()
+    term_sketch = TermSketch(config).update(terms)
+
+    estimates = term_sketch.estimate(exact.index.tolist()).set_index('term')['frequency']
+    errors = estimates - exact
+    assert term_sketch.total == len(terms)
+    assert (errors >= 0).all()
+    assert (errors <= config.epsilon * len(terms)).mean() >= 1 - config.delta
+
+def test_term_sketch_top_k():
+    '''
+    Verifies that the approximate top-k terms agree with the exact top-k terms
+    '''
+    terms = _zipf_terms(n_terms=20000, n_occurrences=50000, seed=2)
+    term_sketch = TermSketch(SketchConfig(capacity=100)).update(terms)
+    assert set(term_sketch.top_k(10)['term']) == set(terms.value_counts().head(10).index)
+
+def test_term_sketch_merge():
+    '''
+    Verifies that sketches built over separate pages merge into (and serialise as) the equivalent single-pass sketch
+    '''
+    terms = _zipf_terms(n_terms=5000, n_occurrences=20000, seed=3)
+    single = TermSketch().update(terms)
+    merged = TermSketch().update(terms[:5000]).merge(TermSketch().update(terms[5000:]))
+    restored = TermSketch.from_bytes(merged.to_bytes())
+
+    assert (restored.cms.table == single.cms.table).all()
+    assert restored.top_k(5)['term'].tolist() == single.top_k(5)['term'].tolist()
+
+def _archive_headlines(n_years: int, n_per_month: int, seed: int) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    vocabulary = np.array([f'word{n}' for n in range(5000)])
+    dates = pd.date_range('2010-01-01', periods=n_years * 12, freq='MS', tz='UTC').repeat(n_per_month)
+    headlines = [' '.join(words) for words in rng.choice(vocabulary, size=(len(dates), 8))]
+    headlines_df = pd.DataFrame({'publication_date': dates, 'headline': headlines})
+    headlines_df['year'] = headlines_df['publication_date'].dt.year
+    headlines_df['month'] = headlines_df['publication_date'].dt.month
+    return headlines_df
+
+def test_headline_index_search():
+    '''
+    Verifies that headlines can be looked up by (case-insensitive) term, period and source, and that re-indexing is idempotent
+    '''
+    headlines_df = _convert_headlines_to_df([{'publication_date': pd.to_datetime('2023-09-01T08:00:00Z'), 'headline': 'Apple harvest fails'},
+                                             {'publication_date': pd.to_datetime('2023-10-01T08:00:00Z'), 'headline': 'Apple prices soar'},
+                                             {'publication_date': pd.to_datetime('2023-10-02T08:00:00Z'), 'headline': 'Banana "split"'}])
+    index = HeadlineIndex()
+    assert index.add('Guardian', headlines_df) == 3
+    assert index.add('Guardian', headlines_df) == 0
+    assert index.add('New York Times', headlines_df.head(1)) == 1
+
+    assert len(index.search('apple')) == 3
+    assert index.search('apple', year=2023, month=10)['headline'].tolist() == ['Apple prices soar']
+    assert index.search('apple', year=2023, source_alias='New York Times')['headline'].tolist() == ['Apple harvest fails']
+    assert index.search('split')['headline'].tolist() == ['Banana "split"']
+    assert index.search('cherry').empty
+
+def test_headline_index_archive(tmp_path):
+    '''
+    Verifies that term lookups over a 10-year archive return only matching headlines for the period, most recently published first
+    '''
+    headlines_df = _archive_headlines(n_years=10, n_per_month=500, seed=1)
+    index = HeadlineIndex(str(tmp_path / 'headlines.db'))
+    # NB: indexed in reverse, so that insertion order disagrees with publication order
+    index.add('Guardian', headlines_df.iloc[::-1])
+    results_df = index.search('word42', year=2015, source_alias='Guardian', limit=1000)
+    expected_df = headlines_df[(headlines_df['year'] == 2015) & headlines_df['headline'].str.split().map(lambda words: 'word42' in words)]
+    assert len(results_df) == len(expected_df) > 0
+    assert (results_df['year'] == 2015).all()
+    assert results_df['publication_date'].is_monotonic_decreasing
+    assert results_df['publication_date'].iloc[0] == str(expected_df['publication_date'].max())
+
+def test_headline_index_identifiers(tmp_path):
+    '''
+    Verifies that headlines sharing a publication time are all indexed, that sources are matched whole and that an index
+    created with the earlier schema is rebuilt
+    '''
+    headlines_df = _convert_headlines_to_df([{'publication_date': pd.to_datetime('2023-09-01T08:00:00Z'), 'headline': 'Apple harvest fails'},
+                                             {'publication_date': pd.to_datetime('2023-09-01T08:00:00Z'), 'headline': 'Apple prices soar'},
+                                             {'publication_date': pd.to_datetime('2023-09-02T08:00:00Z'), 'headline': 'Apple exports rise'}])
+    index = HeadlineIndex()
+    assert index.add('New York Times', headlines_df.head(2)) == 2
+    assert index.add('York Times', headlines_df) == 3
+    assert index.add('New York Times', headlines_df) == 1
+    results_df = index.search('apple', source_alias='New York Times')
+    assert results_df['headline'].tolist()[0] == 'Apple exports rise'
+    assert results_df['headline_id'].is_monotonic_decreasing and len(results_df) == 3
+    assert len(index.search('apple', source_alias='York Times')) == 3
+
+    path = str(tmp_path / 'headlines.db')
+    connection = sqlite3.connect(path)
+    connection.executescript('''CREATE TABLE headline (headline_id INTEGER PRIMARY KEY, digest BLOB UNIQUE, source TEXT, year INTEGER,
+                                                         month INTEGER, period TEXT, publication_date TEXT, headline TEXT);
+                                 INSERT INTO headline VALUES (1, x'00', 'Guardian', 2023, 9, 'y2023 m202309', '2023-09-01 08:00:00+00:00', 'Apple harvest fails');''')
+    connection.close()
+    index = HeadlineIndex(path)
+    assert index.search('apple', year=2023, month=9, source_alias='Guardian')['headline'].tolist() == ['Apple harvest fails']
+    assert index.add('Guardian', headlines_df.head(1)) == 0
+
+class _FakeGuardianResponse():
+    def __init__(self, params: dict, articles_per_day: int):
+        start, end = pd.Timestamp(params['from-date']), pd.Timestamp(params['to-date'])
+        dates = pd.date_range(start, end, freq='D').repeat(articles_per_day)
+        page, page_size = params['page'], params['page-size']
+        results = [{'webPublicationDate': f'{day.date()}T12:00:00Z', 'webTitle': f'Headline {n}'}
+                   for n, day in enumerate(dates)][(page - 1) * page_size:page * page_size]
+        self.body = {'response': {'pages': -(-len(dates) // page_size), 'results': results}}
+        self.content = str(self.body).encode('utf-8')
+
+    def raise_for_status(self) -> None:
+        pass
+
+    def json(self) -> dict:
+        return self.body
+
+def test_request_guardian_window(monkeypatch):
+    '''
+    Verifies that the Guardian window is requested at the maximum page size, with every page but the last full and the first page reused, and tallied
+    '''
+    monkeypatch.setattr(resources.time, 'sleep', lambda delay: None)
+    monkeypatch.setattr(resources.requests, 'get', lambda url, params: _FakeGuardianResponse(params, articles_per_day=250))
+
+    stats = RequestStats()
+    headlines_df = resources._request_guardian_window(date(2023, 9, 1), date(2023, 9, 1), 'key', stats=stats)
+    assert len(headlines_df) == 250
+    assert stats.n_requests == 2 and stats.n_bytes > 0
+
+    stats = RequestStats()
+    headlines_df = resources._request_guardian_window(date(2023, 9, 1), date(2023, 9, 30), 'key', stats=stats)
+    assert len(headlines_df) == 7500
+    assert headlines_df['publication_date'].is_monotonic_increasing
+    assert headlines_df['headline'].is_unique
+    assert stats.n_requests == -(-7500 // resources.GUARDIAN_MAX_PAGE_SIZE)
+
+def test_deduplicate_headlines():
+    '''
+    Verifies that exact (normalised) duplicates are always removed and near-duplicates only when configured
+    '''
+    headlines_df = pd.DataFrame({'headline': ['Live: Election results – latest updates',
+                                              'LIVE: election results - latest updates!',
+                                              'Live: Election results – latest updates as they happened',
+                                              'Apple prices soar',
+                                              'Apple prices soar'],
+                                 'year': [2023, 2023, 2023, 2023, 2023],
+                                 'month': [9, 9, 9, 9, 10]})
+    assert deduplicate_headlines(headlines_df)['headline'].tolist() == ['Live: Election results – latest updates',
+                                                                       'Live: Election results – latest updates as they happened',
+                                                                       'Apple prices soar',
+                                                                       'Apple prices soar']
+    near_df = deduplicate_headlines(headlines_df, DedupConfig(near=True, threshold=0.6))
+    assert near_df['headline'].tolist() == ['Live: Election results – latest updates', 'Apple prices soar', 'Apple prices soar']
+
+def test_deduplicate_headlines_near_recall():
+    '''
+    Verifies that lightly edited copies of headlines are detected as near-duplicates whilst distinct headlines are retained
+    '''
+    headlines_df = _archive_headlines(n_years=1, n_per_month=500, seed=2).query('month == 1')
+    edited_df = headlines_df.head(100).assign(headline=lambda df: df['headline'] + ' (updated)')
+    deduplicated_df = deduplicate_headlines(pd.concat([headlines_df, edited_df], ignore_index=True), DedupConfig(near=True, threshold=0.7))
+    assert len(deduplicated_df) == len(headlines_df)
+
+def test_deduplicate_sources():
+    '''
+    Verifies that headlines syndicated across sources are retained by the first source only
+    '''
+    headlines = {'New York Times': pd.DataFrame({'headline': ['Apple prices soar', 'Banana split'], 'year': 2023, 'month': 9}),
+                 'Guardian': pd.DataFrame({'headline': ['Apple Prices Soar', 'Cherry blossom'], 'year': 2023, 'month': 9})}
+    deduplicated = deduplicate_sources(headlines)
+    assert deduplicated['New York Times']['headline'].tolist() == ['Apple prices soar', 'Banana split']
+    assert deduplicated['Guardian']['headline'].tolist() == ['Cherry blossom']
+
+def test_transform_cache_roundtrip(tmp_path):
+    '''
+    Verifies that cached term tables are keyed by headline content, configuration and dependencies, and survive a binary roundtrip
+    '''
+    cache = TransformCache(str(tmp_path))
+    headlines_df = pd.DataFrame({'headline': ['apple banana', 'orange'], 'year': 2023, 'month': 9})
+    key = cache.key(headlines_df, TransformConfig())
+    assert key == cache.key(headlines_df.copy(), TransformConfig())
+    assert key != cache.key(headlines_df.assign(headline=['apple banana', 'grape']), TransformConfig())
+    assert key != cache.key(headlines_df, TransformConfig(dedup=DedupConfig()))
+    assert key != cache.key(headlines_df, TransformConfig(), ('tokenizer',))
+    assert cache.key(headlines_df, TransformConfig(), ('tokenizer',)) != cache.key(headlines_df, TransformConfig(), ('tokenizer', 'stop words'))
+
+    terms_df = pd.DataFrame({'term': ['apple', 'banana', 'orange'], 'year': 2023, 'month': 9, 'frequency': [2, 1, 1]})
+    assert cache.get(key) is None
+    cache.put(key, terms_df)
+    assert cache.get(key).equals(terms_df)
+
+def test_transform_cache_eviction(tmp_path):
+    '''
+    Verifies that the least recently used term tables are evicted once the size budget is exceeded
+    '''
+    cache = TransformCache(str(tmp_path))
+    terms_df = pd.DataFrame({'term': ['apple'], 'year': 2023, 'month': 9, 'frequency': [1]})
+    cache.put('first', terms_df)
+    cache.max_bytes = 2 * (tmp_path / 'first.terms').stat().st_size
+    cache.put('second', terms_df)
+    # NB: age both entries explicitly (rather than relying on timestamp resolution), then use the older of the two
+    os.utime(tmp_path / 'first.terms', ns=(0, 0))
+    os.utime(tmp_path / 'second.terms', ns=(1, 1))
+    assert cache.get('first') is not None
+    cache.put('third', terms_df)
+    assert not (tmp_path / 'second.terms').exists()
+    assert (tmp_path / 'first.terms').exists() and (tmp_path / 'third.terms').exists()
+
+def test_transform_cache_tokenize(tmp_path):
+    '''
+    Verifies that only headlines whose tokens are not already cached are tokenized
+    '''
+    tokenized = []
+    def tokenizer(headline: str) -> list[str]:
+        tokenized.append(headline)
+        return headline.split()
+
+    cache = TransformCache(str(tmp_path))
+    first = cache.tokenize(pd.Series(['apple banana', 'orange', 'apple banana']), tokenizer)
+    second = cache.tokenize(pd.Series(['orange', 'grape fruit']), tokenizer)
+    assert first.tolist() == [['apple', 'banana'], ['orange'], ['apple', 'banana']]
+    assert second.tolist() == [['orange'], ['grape', 'fruit']]
+    assert tokenized == ['apple banana', 'orange', 'grape fruit']
+
+def test_transform_cache_tokenize_invalidation(tmp_path, monkeypatch):
+    '''
+    Verifies that cached tokens are discarded once the tokenizer or the cache version changes
+    '''
+    from nuada.pipeline import cache as cache_module
+    separator = {'value': ' '}
+    def tokenizer(headline: str) -> list[str]:
+        return headline.split(separator['value'])
+
+    cache = TransformCache(str(tmp_path))
+    assert cache.tokenize(pd.Series(['apple banana']), tokenizer).tolist() == [['apple', 'banana']]
+    assert cache.tokenize(pd.Series(['apple banana']), lambda headline: headline.upper().split()).tolist() == [['APPLE', 'BANANA']]
+    assert cache.tokenize(pd.Series(['apple banana']), tokenizer).tolist() == [['apple', 'banana']]
+
+    # NB: same tokenizer, changed behaviour: stale tokens are served until the cache version is bumped
+    separator['value'] = 'n'
+    assert cache.tokenize(pd.Series(['apple banana']), tokenizer).tolist() == [['apple', 'banana']]
+    monkeypatch.setattr(cache_module, '_CACHE_VERSION', cache_module._CACHE_VERSION + 1)
+    assert cache.tokenize(pd.Series(['apple banana']), tokenizer).tolist() == [['apple ba', 'a', 'a']]
+    cache.close()
@@ -0,0 +1,51 @@
+import os
+import subprocess
+import sys
+import time
+import pytest
+
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+HEAVY_MODULES = ('pandas', 'numpy', 'nltk', 'sqlalchemy', 'requests')
+STARTUP_BUDGET = 0.5 # NB: seconds; the eager imports of `pandas`, `nltk` and `sqlalchemy` alone comfortably exceed this
+
+def _run(*args: str) -> subprocess.CompletedProcess:
+    env = {**os.environ, 'PYTHONPATH': str(ROOT / 'src')}
+    return subprocess.run([sys.executable, *args], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+
+def test_import_is_lazy():
+    '''
+    Verifies that importing the package does not import any heavy dependencies
+    '''
+    res = _run('-c', f'import sys, nuada; print(",".join(m for m in {HEAVY_MODULES!r} if m in sys.modules))')
+    assert res.stdout.strip() == ''
+
+def test_lazy_attributes_resolve():
+    '''
+    Verifies that public names resolve to their implementations on first access
+    '''
+    import nuada
+    from nuada.db import DatabaseManager
+    assert nuada.DatabaseManager is DatabaseManager
+    assert set(nuada.__all__) <= set(dir(nuada))
+    with pytest.raises(AttributeError):
+        nuada.not_an_attribute
+
+def test_cli_startup_budget():
+    '''
+    Verifies that the pipeline entry point can describe itself (`--help`) within the startup budget and without heavy dependencies
+    '''
+    pytest.importorskip('click')
+    pytest.importorskip('dotenv')
+    elapsed = []
+    for _ in range(3):
+        start = time.perf_counter()
+        _run('_pipeline.py', '--help')
+        elapsed.append(time.perf_counter() - start)
+    assert min(elapsed) < STARTUP_BUDGET
+    res = _run('-c', f'import sys, runpy; sys.argv = ["_pipeline.py", "--help"]\n'
+                     f'try: runpy.run_path("_pipeline.py", run_name="__main__")\n'
+                     f'except SystemExit: pass\n'
+                     f'print(",".join(m for m in {HEAVY_MODULES!r} if m in sys.modules), file=sys.stderr)')
+    assert res.stderr.strip() == ''